@@ -0,0 +1,421 @@
+#!/usr/bin/env python3
+# coding: utf-8
+#
+# Asm4_batch.py
+#
+# LGPL
+# Copyright HUBERT Zoltán
+#
+# update Assembly4 files and export their BOM without the GUI, for batch and CI use
+# this file must not import any GUI module, it is run by FreeCADCmd :
+#
+#   FreeCADCmd Asm4_batch.py --pass update [--jobs N] [--no-save] [--report FILE] file1.FCStd file2.FCStd ...
+#   FreeCADCmd Asm4_batch.py --pass bom [--format csv|jsonl|parquet] [--output DIR] [--local] [--light] file1.FCStd ...
+#   FreeCADCmd Asm4_batch.py --pass tree file1.FCStd ...
+#
+# or from a FreeCADCmd session :
+#
+#   import Asm4_batch
+#   Asm4_batch.main(['update', 'file1.FCStd', 'file2.FCStd'])
+
+
+
+import os, sys, json, time, argparse, subprocess
+from concurrent.futures import ThreadPoolExecutor
+
+import FreeCAD as App
+from FreeCAD import Console as FCC
+
+import Asm4_solver
+import Asm4_bom
+import Asm4_fcstd
+
+
+
+"""
+    +-----------------------------------------------+
+    |                 some definitions              |
+    +-----------------------------------------------+
+"""
+# the results of worker processes are printed on lines starting with this
+resultTag = 'ASM4_RESULT '
+
+batchPath = os.path.dirname(os.path.abspath(__file__))
+
+
+# the FreeCADCmd executable used for worker processes
+def findFreeCADCmd():
+    binPath = os.path.join( App.getHomePath(), 'bin' )
+    for name in [ 'FreeCADCmd', 'FreeCADCmd.exe', 'freecadcmd' ]:
+        exe = os.path.join( binPath, name )
+        if os.path.isfile(exe):
+            return exe
+    return 'FreeCADCmd'
+
+
+# FreeCADCmd passes its own arguments to the script, ours come after --pass
+def scriptArgs( argv ):
+    for sep in [ '--pass', '--' ]:
+        if sep in argv:
+            return argv[ argv.index(sep)+1: ]
+    return argv[1:]
+
+
+
+"""
+    +-----------------------------------------------+
+    |              update a single file             |
+    +-----------------------------------------------+
+"""
+def updateFile( path, save=True ):
+    result = { 'file': path, 'ok': False, 'objects': None,
+               'open': 0.0, 'update': 0.0, 'save': 0.0, 'error': '' }
+    doc = None
+    try:
+        start = time.perf_counter()
+        doc = App.openDocument(path)
+        result['open'] = time.perf_counter() - start
+        start = time.perf_counter()
+        # a restored document is tracked with nothing dirty, so the update
+        # must be the full one, the report shows 'all'
+        Asm4_solver.fullUpdate(doc)
+        result['objects'] = None
+        result['update'] = time.perf_counter() - start
+        if save:
+            start = time.perf_counter()
+            doc.save()
+            result['save'] = time.perf_counter() - start
+        result['ok'] = True
+    except Exception as err:
+        result['error'] = str(err)
+    finally:
+        if doc is not None:
+            App.closeDocument(doc.Name)
+    return result
+
+
+def updateFiles( files, save=True ):
+    results = []
+    for path in files:
+        results.append( updateFile(path, save) )
+    return results
+
+
+
+"""
+    +-----------------------------------------------+
+    |         BOM of a file, into a data file       |
+    +-----------------------------------------------+
+"""
+# the BOM file written next to the assembly file, or in output
+def bomFileName( path, fmt, output=None ):
+    name = os.path.splitext(os.path.basename(path))[0] + '_BOM.' + fmt
+    return os.path.join( output or os.path.dirname(path), name )
+
+
+# with a Asm4_fcstd.fileReader the files are only read, not opened in FreeCAD
+def bomFile( path, fmt='csv', output=None, follow=True, reader=None ):
+    result = { 'file': path, 'ok': False, 'rows': None, 'output': '',
+               'open': 0.0, 'bom': 0.0, 'export': 0.0, 'error': '' }
+    doc = None
+    try:
+        start = time.perf_counter()
+        if reader is not None:
+            fileDoc = reader.open(path)
+            if fileDoc is None:
+                raise RuntimeError('could not read this file')
+            assy = fileDoc.findAssembly()
+        else:
+            doc = App.openDocument(path)
+            assy = Asm4_solver.findAssembly(doc)
+        result['open'] = time.perf_counter() - start
+        if assy is None:
+            raise RuntimeError('no Assembly4 assembly in this file')
+        start = time.perf_counter()
+        # without the GUI the missing part info properties are not filled
+        engine = Asm4_bom.bomEngine( followSubassemblies=follow,
+                                     cache=Asm4_bom.getCache() if follow else None )
+        engine.build(assy)
+        result['bom'] = time.perf_counter() - start
+        start = time.perf_counter()
+        result['output'] = bomFileName(path, fmt, output)
+        result['rows'] = Asm4_bom.exportBOM( engine, result['output'], fmt )
+        result['export'] = time.perf_counter() - start
+        result['ok'] = True
+    except Exception as err:
+        result['error'] = str(err)
+    finally:
+        if doc is not None:
+            App.closeDocument(doc.Name)
+    return result
+
+
+def bomFiles( files, fmt='csv', output=None, follow=True, light=False ):
+    # the files shared by several assemblies are read only once
+    reader = Asm4_fcstd.fileReader() if light else None
+    results = []
+    for path in files:
+        results.append( bomFile(path, fmt, output, follow, reader) )
+    return results
+
+
+# only put the BOM of a sub-assembly file in the on-disk cache, for its parents
+def cacheBOMFile( path ):
+    result = { 'file': path, 'ok': False, 'rows': None, 'output': 'cache',
+               'open': 0.0, 'bom': 0.0, 'export': 0.0, 'error': '' }
+    doc = None
+    try:
+        start = time.perf_counter()
+        doc = App.openDocument(path)
+        result['open'] = time.perf_counter() - start
+        start = time.perf_counter()
+        assy = Asm4_solver.findAssembly(doc)
+        # a file of parts, its parents list them themselves
+        result['rows'] = 0
+        cache = Asm4_bom.getCache()
+        if assy is not None and cache is not None:
+            engine = Asm4_bom.bomEngine( cache=cache )
+            engine.build(assy)
+            result['rows'] = len(engine.rows)
+        result['bom'] = time.perf_counter() - start
+        result['ok'] = True
+    except Exception as err:
+        result['error'] = str(err)
+    finally:
+        if doc is not None:
+            App.closeDocument(doc.Name)
+    return result
+
+
+
+"""
+    +-----------------------------------------------+
+    |     the BOM of many files, bottom-up, over    |
+    |           FreeCADCmd worker processes         |
+    +-----------------------------------------------+
+"""
+# the FCStd files that a file links to, from its Document.xml: the file isn't opened
+def linkedFiles( path, reader ):
+    doc = reader.open(path)
+    if doc is None:
+        FCC.PrintWarning( 'Could not read the links of '+path+'\n' )
+        return []
+    return [ f for f in doc.linkedFiles() if os.path.isfile(f) ]
+
+
+# file -> level, the files without links are at level 0,
+# the others one level above the highest of their linked files
+def fileLevels( files, reader=None ):
+    if reader is None:
+        reader = Asm4_fcstd.fileReader()
+    links  = {}
+    stack  = list(files)
+    while stack:
+        path = stack.pop()
+        if path not in links:
+            links[path] = linkedFiles(path, reader)
+            stack.extend( links[path] )
+    levels = {}
+    for path in links:
+        stack = [ (path, False) ]
+        # a cycle of files is cut where it is found
+        visiting = set()
+        while stack:
+            (f, done) = stack.pop()
+            if done:
+                levels[f] = max( [ levels[sub]+1 for sub in links[f] if sub in levels ] or [0] )
+                visiting.discard(f)
+            elif f not in levels and f not in visiting:
+                visiting.add(f)
+                stack.append( (f, True) )
+                stack.extend( (sub, False) for sub in links[f] )
+    return levels
+
+
+# the sub-assembly files are done level by level, each in its own worker, and their
+# BOMs go to the on-disk cache where the parents' workers pick them up
+def isAssemblyFile( path, reader ):
+    doc = reader.open(path)
+    return doc is not None and doc.findAssembly() is not None
+
+
+# without the cache, each worker walks its sub-assemblies itself
+def parallelBOM( files, options, jobs, freecadcmd=None ):
+    if Asm4_bom.getCache() is None:
+        return runParallel( 'bom', files, options, jobs, freecadcmd )
+    reader = Asm4_fcstd.fileReader()
+    levels = fileLevels(files, reader)
+    results = []
+    for level in sorted( set(levels.values()) ):
+        todo = [ f for f in levels if levels[f] == level ]
+        # files of parts have no BOM of their own
+        subs = [ f for f in todo if f not in files and isAssemblyFile(f, reader) ]
+        tops = [ f for f in files if f in todo ]
+        results.extend( runParallel( 'bomcache', subs, options, jobs, freecadcmd ) )
+        results.extend( runParallel( 'bom', tops, options, jobs, freecadcmd ) )
+    return results
+
+
+
+"""
+    +-----------------------------------------------+
+    |       spread the files over FreeCADCmd        |
+    |              worker processes                 |
+    +-----------------------------------------------+
+"""
+def runWorker( freecadcmd, command, files, options ):
+    code  = 'import sys; sys.path.insert(0, '+repr(batchPath)+'); '
+    code += 'import Asm4_batch; Asm4_batch.worker('+repr(command)+', '+repr(files)+', '+repr(options)+')'
+    proc = subprocess.run( [freecadcmd, '-c', code], stdout=subprocess.PIPE,
+                           stderr=subprocess.STDOUT, universal_newlines=True )
+    results = []
+    for line in proc.stdout.splitlines():
+        if line.startswith(resultTag):
+            results.append( json.loads(line[len(resultTag):]) )
+    # files whose result never came back
+    done = [ r['file'] for r in results ]
+    for path in files:
+        if path not in done:
+            results.append( { 'file': path, 'ok': False, 'error': 'worker exited with code '+str(proc.returncode) } )
+    return results
+
+
+# the entry point of a worker process
+def worker( command, files, options ):
+    for path in files:
+        if command == 'update':
+            result = updateFile( path, options.get('save', True) )
+        elif command == 'bom':
+            result = bomFile( path, options.get('format', 'csv'), options.get('output'),
+                              options.get('follow', True) )
+        elif command == 'bomcache':
+            result = cacheBOMFile( path )
+        else:
+            result = { 'file': path, 'ok': False, 'error': 'unknown command '+command }
+        print( resultTag + json.dumps(result) )
+        sys.stdout.flush()
+
+
+# one file per task, so that a slow file doesn't hold back a whole chunk
+def runParallel( command, files, options, jobs, freecadcmd=None ):
+    if not files:
+        return []
+    if freecadcmd is None:
+        freecadcmd = findFreeCADCmd()
+    results = []
+    with ThreadPoolExecutor(max_workers=jobs) as pool:
+        tasks = [ pool.submit(runWorker, freecadcmd, command, [path], options) for path in files ]
+        for task in tasks:
+            results.extend( task.result() )
+    return results
+
+
+
+"""
+    +-----------------------------------------------+
+    |                    report                     |
+    +-----------------------------------------------+
+"""
+def printReport( results, elapsed ):
+    failed = 0
+    for r in results:
+        if r['ok'] and 'rows' in r:
+            FCC.PrintMessage( '{}: {} BOM rows in {:.3f} s written to {} (open {:.3f} s, export {:.3f} s)\n'.format(
+                              r['file'], r['rows'], r['bom'], r['output'], r['open'], r['export'] ) )
+        elif r['ok']:
+            objects = 'all' if r['objects'] is None else str(r['objects'])
+            FCC.PrintMessage( '{}: updated {} objects in {:.3f} s (open {:.3f} s, save {:.3f} s)\n'.format(
+                              r['file'], objects, r['update'], r['open'], r['save'] ) )
+        else:
+            failed += 1
+            FCC.PrintError( r['file']+': '+r['error']+'\n' )
+    FCC.PrintMessage( '{} file(s), {} failed, {:.3f} s\n'.format(len(results), failed, elapsed) )
+    return failed
+
+
+
+"""
+    +-----------------------------------------------+
+    |                 command line                  |
+    +-----------------------------------------------+
+"""
+def makeParser():
+    parser = argparse.ArgumentParser( prog='Asm4_batch',
+                description='Update Assembly4 files and list their parts without the GUI' )
+    commands = parser.add_subparsers( dest='command' )
+    update = commands.add_parser( 'update', help='solve and save assemblies' )
+    update.add_argument( 'files', nargs='+', help='.FCStd files' )
+    update.add_argument( '-j', '--jobs', type=int, default=1,
+                help='number of FreeCADCmd worker processes' )
+    update.add_argument( '--freecadcmd', default=None,
+                help='FreeCADCmd executable used by the workers' )
+    update.add_argument( '--no-save', dest='save', action='store_false',
+                help="don't save the updated files" )
+    update.add_argument( '--report', default=None,
+                help='write the timings to this JSON file' )
+    bom = commands.add_parser( 'bom', help='write the bill of materials to data files' )
+    bom.add_argument( 'files', nargs='+', help='.FCStd files' )
+    bom.add_argument( '-f', '--format', default='csv', choices=['csv', 'jsonl', 'parquet'],
+                help='format of the BOM files (parquet needs pyarrow)' )
+    bom.add_argument( '-o', '--output', default=None,
+                help='directory of the BOM files, next to the FCStd files by default' )
+    bom.add_argument( '--local', dest='follow', action='store_false',
+                help="don't follow the sub-assemblies" )
+    bom.add_argument( '--light', action='store_true',
+                help="only read the structure of the files, don't open them in FreeCAD" )
+    bom.add_argument( '-j', '--jobs', type=int, default=1,
+                help='number of FreeCADCmd worker processes' )
+    bom.add_argument( '--freecadcmd', default=None,
+                help='FreeCADCmd executable used by the workers' )
+    bom.add_argument( '--report', default=None,
+                help='write the timings to this JSON file' )
+    tree = commands.add_parser( 'tree', help='print the tree of linked files, without opening them' )
+    tree.add_argument( 'files', nargs='+', help='.FCStd files' )
+    return parser
+
+
+def main( argv=None ):
+    if argv is None:
+        argv = scriptArgs(sys.argv)
+    args = makeParser().parse_args(argv)
+    if args.command is None:
+        makeParser().print_help()
+        return 2
+    files = [ os.path.abspath(f) for f in args.files ]
+    if args.command == 'tree':
+        reader = Asm4_fcstd.fileReader()
+        for path in files:
+            FCC.PrintMessage( Asm4_fcstd.fileTree(path, reader) or path+': could not be read\n' )
+        return 0
+    start = time.perf_counter()
+    if args.command == 'update':
+        if args.jobs > 1 and len(files) > 1:
+            results = runParallel( 'update', files, {'save': args.save}, args.jobs, args.freecadcmd )
+        else:
+            results = updateFiles( files, args.save )
+    elif args.command == 'bom':
+        output = os.path.abspath(args.output) if args.output else None
+        if output:
+            os.makedirs(output, exist_ok=True)
+        options = {'format': args.format, 'output': output, 'follow': args.follow}
+        if args.light:
+            results = bomFiles( files, args.format, output, args.follow, light=True )
+        # the sub-assembly files are spread over the workers too
+        elif args.jobs > 1 and args.follow:
+            results = parallelBOM( files, options, args.jobs, args.freecadcmd )
+        elif args.jobs > 1 and len(files) > 1:
+            results = runParallel( 'bom', files, options, args.jobs, args.freecadcmd )
+        else:
+            results = bomFiles( files, args.format, output, args.follow )
+    elapsed = time.perf_counter() - start
+    failed = printReport( results, elapsed )
+    if args.report:
+        with open(args.report, 'w') as report:
+            json.dump( {'elapsed': elapsed, 'files': results}, report, indent=2 )
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    status = main()
+    # FreeCADCmd would otherwise stay in its interactive console
+    sys.exit(status)
@@ -0,0 +1,360 @@
+#!/usr/bin/env python3
+# coding: utf-8
+#
+# Asm4_benchmark.py
+#
+# LGPL
+# Copyright HUBERT Zoltán
+#
+# generates synthetic Assembly4 assemblies and times the main operations on them
+# it needs the GUI, from the FreeCAD Python console :
+#
+#   import Asm4_benchmark
+#   Asm4_benchmark.run( parts=200, lcs=4, depth=2, fasteners=50, arrays=5, output='bench.json' )
+#
+# or from the command line :
+#
+#   FreeCAD Asm4_benchmark.py --pass --parts 200 --depth 2 --output bench.json
+
+
+
+import os, sys, json, time, shutil, tempfile, argparse, platform, statistics
+
+import FreeCADGui as Gui
+import FreeCAD as App
+from FreeCAD import Console as FCC
+
+import Asm4_libs as Asm4
+import Asm4_solver
+import Asm4_lazy
+from Asm4_objects import ViewProviderArray, ExpressionArray
+
+
+
+"""
+    +-----------------------------------------------+
+    |                 some definitions              |
+    +-----------------------------------------------+
+"""
+# the operations that are timed, in this order
+benchSteps = [ 'update_full', 'update_incremental', 'update_native',
+               'arrays', 'bom', 'config_save', 'config_restore',
+               'lcs_show', 'lcs_hide', 'tree_listing' ]
+
+# default size of the generated assembly
+defaultSize = { 'parts':     100,
+                'lcs':       4,
+                'depth':     1,
+                'branch':    3,
+                'fasteners': 20,
+                'arrays':    2,
+                'count':     6 }
+
+
+
+"""
+    +-----------------------------------------------+
+    |         generate a synthetic assembly         |
+    +-----------------------------------------------+
+"""
+# LCS_0 at the origin of the container and some more LCS
+def addLCS( container, nLCS ):
+    lcs0 = container.newObject('PartDesign::CoordinateSystem','LCS_0')
+    lcs0.Support = [(container.Origin.OriginFeatures[0],'')]
+    lcs0.MapMode = 'ObjectXY'
+    lcs0.MapReversed = False
+    for i in range(1, nLCS):
+        lcs = container.newObject('PartDesign::CoordinateSystem','LCS_'+str(i))
+        lcs.Placement = App.Placement( App.Vector(10*i, 0, 0), App.Rotation(Asm4.VEC_Z, 30*i) )
+
+
+# the real names of the LCS made by addLCS(), FreeCAD renames them if they exist in the document
+def lcsNames( container ):
+    return [ o.Name for o in container.Group
+             if o.TypeId == 'PartDesign::CoordinateSystem' and o.Name != 'LCS_Origin' ]
+
+
+# a part with an LCS at its origin, some more LCS and a box to have geometry
+def makePart( doc, name, nLCS, withBox=True ):
+    part = doc.addObject('App::Part', name)
+    addLCS( part, nLCS )
+    if withBox:
+        box = part.newObject('Part::Box','Box')
+        box.Length = 10*nLCS
+    partsGroup = doc.getObject('Parts')
+    if partsGroup:
+        partsGroup.addObject(part)
+    return part
+
+
+# attach link number i in container to link (i-1)//2, the first one to the container's LCS
+# this gives a balanced attachment tree. All the links are to target
+def attachLinks( container, links, rootLCS, target ):
+    targetDoc = target.Document.Name
+    targetLCS = lcsNames(target)
+    for i, link in enumerate(links):
+        if i == 0:
+            a_Link = 'Parent Assembly'
+            a_LCS  = rootLCS
+            expr = Asm4.makeExpressionPart( a_Link, None, a_LCS, targetDoc, targetLCS[0] )
+        else:
+            a_Link = links[(i-1)//2].Name
+            a_LCS  = targetLCS[ i % max(len(targetLCS)-1, 1) + 1 ] if len(targetLCS) > 1 else targetLCS[0]
+            expr = Asm4.makeExpressionPart( a_Link, targetDoc, a_LCS, targetDoc, targetLCS[0] )
+        Asm4.makeAsmProperties(link)
+        link.AttachedBy = '#'+targetLCS[0]
+        link.AttachedTo = a_Link+'#'+a_LCS
+        link.SolverId = 'Asm4EE'
+        link.setExpression('Placement', expr)
+
+
+def makeLinks( container, target, number, prefix ):
+    links = []
+    for i in range(number):
+        link = container.newObject('App::Link', prefix+str(i+1))
+        link.LinkedObject = target
+        links.append(link)
+    return links
+
+
+# same as the makeArrayCmd commands, without the selection
+def makeArray( arrayCmd, srcObj, axisObj, sub, count ):
+    objParent = srcObj.getParentGeoFeatureGroup()
+    obj = srcObj.Document.addObject( 'Part::FeaturePython', arrayCmd.namePrefix + srcObj.Name,
+                                     ExpressionArray(), None, True )
+    obj.ArrayType = arrayCmd.arrayType
+    obj.setPropertyStatus('ArrayType', 'ReadOnly')
+    obj.Label = arrayCmd.namePrefix + srcObj.Label
+    obj.Axis = axisObj, sub
+    ViewProviderArray(obj.ViewObject)
+    objParent.addObject(obj)
+    obj.setLink(srcObj)
+    arrayCmd._setupProperties(obj)
+    obj.Count = count
+    return obj
+
+
+# the block and each level of sub-assemblies are in their own file, in a temporary
+# directory, so that the linked files are handled like in real projects
+def makeAssembly( parts=100, lcs=4, depth=1, branch=3, fasteners=20, arrays=2, count=6, docName='Asm4Bench' ):
+    import makeArrayCmd
+    directory = tempfile.mkdtemp(prefix=docName+'_')
+    # the deepest level is a plain part, each sub-assembly links the level below
+    blockDoc = App.newDocument(docName+'_Block')
+    target = makePart( blockDoc, 'Block', lcs )
+    blockDoc.recompute()
+    blockDoc.saveAs( os.path.join(directory, blockDoc.Name+'.FCStd') )
+    for level in range(1, depth):
+        subDoc = App.newDocument(docName+'_Sub'+str(level))
+        App.setActiveDocument(subDoc.Name)
+        Asm4.create_assembly()
+        sub = Asm4.getAssembly()
+        addLCS( sub, lcs )
+        links = makeLinks( sub, target, branch, 'Sub'+str(level)+'_' )
+        attachLinks( sub, links, 'LCS_Origin', target )
+        subDoc.recompute()
+        subDoc.saveAs( os.path.join(directory, subDoc.Name+'.FCStd') )
+        target = sub
+    # the top level
+    doc = App.newDocument(docName)
+    App.setActiveDocument(doc.Name)
+    Asm4.create_assembly()
+    assy = Asm4.getAssembly()
+    links = makeLinks( assy, target, parts, 'Part_' )
+    attachLinks( assy, links, 'LCS_Origin', target )
+    # fasteners are attached by their origin, as in FastenersLib
+    targetLCS = lcsNames(target)
+    for k in range(fasteners):
+        fastener = assy.newObject('Part::Cylinder', 'Fastener_'+str(k+1))
+        fastener.Radius = 1.5
+        fastener.Height = 10
+        link = links[ k % len(links) ]
+        a_LCS = targetLCS[ k % len(targetLCS) ]
+        Asm4.makeAsmProperties(fastener)
+        fastener.AttachedBy = 'Origin'
+        fastener.AttachedTo = link.Name+'#'+a_LCS
+        fastener.SolverId = 'Asm4EE'
+        fastener.setExpression( 'Placement', Asm4.makeExpressionDatum(link.Name, target.Document.Name, a_LCS) )
+    # alternate circular and linear arrays on the assembly's LCS
+    axis = assy.getObject('LCS_Origin')
+    for a in range(arrays):
+        arrayCmd = makeArrayCmd.makeCircularArray() if a % 2 == 0 else makeArrayCmd.makeLinearArray()
+        makeArray( arrayCmd, links[ a % len(links) ], axis, ['Z'], count )
+    doc.recompute()
+    doc.saveAs( os.path.join(directory, doc.Name+'.FCStd') )
+    return doc
+
+
+# close the generated documents and remove their files
+def closeAssembly( doc ):
+    directory = os.path.dirname(doc.FileName)
+    docs = [ d for d in doc.getDependentDocuments() if d != doc ]
+    App.closeDocument(doc.Name)
+    for d in docs:
+        if App.listDocuments().get(d.Name) is not None:
+            App.closeDocument(d.Name)
+    shutil.rmtree(directory, ignore_errors=True)
+
+
+
+"""
+    +-----------------------------------------------+
+    |                   timing                      |
+    +-----------------------------------------------+
+"""
+def timeIt( function, repeat ):
+    times = []
+    for i in range(repeat):
+        start = time.perf_counter()
+        function(i)
+        times.append( time.perf_counter() - start )
+    return { 'min':    min(times),
+             'mean':   statistics.mean(times),
+             'max':    max(times),
+             'repeat': repeat }
+
+
+# move the root link, so that everything attached to it needs an update
+def moveRoot( doc, i ):
+    link = doc.getObject('Part_1')
+    link.AttachmentOffset = App.Placement( App.Vector(0, 0, i % 2), App.Rotation() )
+
+
+def benchUpdateFull( doc, i ):
+    Asm4_solver.fullUpdate(doc)
+
+def benchUpdateIncremental( doc, i ):
+    moveRoot(doc, i)
+    Asm4_solver.updateAssembly(doc)
+
+# the native solver alone, on the objects updateAssembly() would solve
+def benchUpdateNative( doc, i ):
+    moveRoot(doc, i)
+    dirty = Asm4_solver.observer.popDirty(doc) or set()
+    for obj in doc.Objects:
+        if obj.isTouched():
+            dirty.add(obj.Name)
+    graph = Asm4_solver.getGraph(doc)
+    Asm4_solver.observer.updating = True
+    try:
+        Asm4_solver.native.solveAll( doc, graph.order(graph.downstream(dirty)), graph )
+    finally:
+        Asm4_solver.observer.updating = False
+
+def benchArrays( doc, i ):
+    arrays = [ o for o in doc.Objects if hasattr(o,'ArrayType') ]
+    for array in arrays:
+        array.touch()
+    doc.recompute(arrays)
+
+def benchBom( doc, i ):
+    makeBomCmd = Asm4_lazy.getModule('makeBomCmd')
+    bom = makeBomCmd.makeBOM()
+    bom.Verbose = str()
+    bom.PartsList = {}
+    bom.listParts( Asm4.getAssembly() )
+    bom.inSpreadsheet()
+
+def benchConfigSave( doc, i ):
+    configurationEngine = Asm4_lazy.getModule('configurationEngine')
+    configurationEngine.SaveConfiguration( 'Bench_'+str(i), 'benchmark' )
+
+def benchConfigRestore( doc, i ):
+    configurationEngine = Asm4_lazy.getModule('configurationEngine')
+    configurationEngine.restoreConfiguration( 'Bench_'+str(i) )
+
+def benchLcsShow( doc, i ):
+    import showHideLcsCmd
+    showHideLcsCmd.showHide(True)
+
+def benchLcsHide( doc, i ):
+    import showHideLcsCmd
+    showHideLcsCmd.showHide(False)
+
+def benchTreeListing( doc, i ):
+    exportFiles = Asm4_lazy.getModule('exportFiles')
+    tree = exportFiles.listLinkedFiles()
+    tree.printChildren( [Asm4.getAssembly()] )
+
+benchFunctions = { 'update_full':        benchUpdateFull,
+                   'update_incremental': benchUpdateIncremental,
+                   'update_native':      benchUpdateNative,
+                   'arrays':             benchArrays,
+                   'bom':                benchBom,
+                   'config_save':        benchConfigSave,
+                   'config_restore':     benchConfigRestore,
+                   'lcs_show':           benchLcsShow,
+                   'lcs_hide':           benchLcsHide,
+                   'tree_listing':       benchTreeListing }
+
+
+
+"""
+    +-----------------------------------------------+
+    |                run the benchmark              |
+    +-----------------------------------------------+
+"""
+def run( repeat=3, steps=None, output=None, keep=False, **size ):
+    params = dict(defaultSize)
+    params.update(size)
+    if steps is None:
+        steps = benchSteps
+    # most commands act on the selection if there is one
+    Gui.Selection.clearSelection()
+    start = time.perf_counter()
+    doc = makeAssembly( **params )
+    results = { 'asm4':     versionInfo(),
+                'freecad':  '.'.join( App.Version()[0:3] ),
+                'python':   platform.python_version(),
+                'numpy':    Asm4_solver.hasNumpy,
+                'params':   params,
+                'objects':  len(doc.Objects),
+                'generate': time.perf_counter() - start,
+                'steps':    {} }
+    try:
+        for step in steps:
+            function = benchFunctions[step]
+            try:
+                results['steps'][step] = timeIt( lambda i: function(doc, i), repeat )
+            except Exception as err:
+                results['steps'][step] = { 'error': str(err) }
+            FCC.PrintMessage( 'Asm4 benchmark '+step+': '+json.dumps(results['steps'][step])+'\n' )
+    finally:
+        if not keep:
+            closeAssembly(doc)
+    if output:
+        with open(output, 'w') as outFile:
+            json.dump( results, outFile, indent=2 )
+    return results
+
+
+# the version in the VERSION file, as in Init.py
+def versionInfo():
+    try:
+        with open( os.path.join(Asm4.wbPath, 'VERSION'), 'r' ) as versionFile:
+            return versionFile.readlines()[1].strip()
+    except Exception:
+        return None
+
+
+def main( argv=None ):
+    if argv is None:
+        argv = sys.argv
+        argv = argv[ argv.index('--pass')+1: ] if '--pass' in argv else []
+    parser = argparse.ArgumentParser( prog='Asm4_benchmark',
+                description='Time Assembly4 operations on a synthetic assembly' )
+    for key, value in defaultSize.items():
+        parser.add_argument( '--'+key, type=int, default=value )
+    parser.add_argument( '--repeat', type=int, default=3 )
+    parser.add_argument( '--steps', default=','.join(benchSteps),
+                help='comma separated list among: '+', '.join(benchSteps) )
+    parser.add_argument( '--output', default=None, help='JSON result file' )
+    args = vars( parser.parse_args(argv) )
+    steps = args.pop('steps').split(',')
+    results = run( steps=steps, **args )
+    if not args['output']:
+        print( json.dumps(results, indent=2) )
+
+
+if __name__ == '__main__':
+    main()
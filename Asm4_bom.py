@@ -0,0 +1,580 @@
+#!/usr/bin/env python3
+# coding: utf-8
+#
+# Asm4_bom.py
+#
+# LGPL
+# Copyright HUBERT Zoltán
+#
+# the Bill of Materials engine
+# this file must not import any GUI module, it is also used by FreeCADCmd
+#
+# the assembly tree is walked with an explicit stack, the counted objects
+# come out of a generator, and the quantities are aggregated in a dict
+# keyed by (document, label)
+#
+# arrays are not walked once per element: each distinct object is walked
+# once and its sub-BOM is multiplied by its number of instances
+#
+# the BOMs of the sub-assembly files can be kept in an on-disk cache (bomCache)
+#
+# the BOM can be written to CSV, JSON lines or Parquet files without any
+# spreadsheet in the document, see exportBOM()
+
+
+
+import os, re, csv, json, hashlib
+
+import FreeCAD as App
+
+import infoKeys
+
+
+
+"""
+    +-----------------------------------------------+
+    |                 some definitions              |
+    +-----------------------------------------------+
+"""
+# the quantity column
+qtyKey = 'Qty.'
+
+# kinds of counted objects
+ASM4_PART  = 'ASM4_PART'
+PART       = 'PART'
+PARTDESIGN = 'PARTDESIGN'
+FASTENER   = 'FASTENER'
+
+# how deep the local BOM goes
+localMaxLevel = 2
+maxLevel      = 100
+
+# the on-disk cache of the sub-assemblies' BOMs
+cacheDir     = os.path.join( App.getUserAppDataDir(), 'Asm4', 'bomCache' )
+cacheVersion = 1
+paramPath    = 'User parameter:BaseApp/Preferences/Mod/Assembly4'
+
+
+# the user's part info keys, or the default ones if the user has none
+def loadInfoKeys( fileName=infoKeys.ConfUserFilejson ):
+    try:
+        with open(fileName, 'r') as keysFile:
+            return json.load(keysFile)
+    except (OSError, ValueError):
+        keys = dict()
+        for prop in infoKeys.partInfo:
+            keys[prop] = {'userData': prop, 'active': True, 'visible': True}
+        for prop in infoKeys.partInfo_Invisible:
+            keys[prop] = {'userData': prop, 'active': True, 'visible': False}
+        return keys
+
+
+# same as Asm4.isAsm4Model()
+def isAsm4Model( obj ):
+    return obj.TypeId=='App::Part' and obj.Name=='Assembly' \
+           and hasattr(obj,'Type') and obj.Type=='Assembly'
+
+
+# objects from the Fasteners workbench
+def isFastener( obj ):
+    content = getattr(obj, 'Content', '')
+    return obj.TypeId=='Part::FeaturePython' and \
+           ( content.find('FastenersCmd') > -1 or content.find('PCBStandoff') > -1 )
+
+
+# ExpressionArray and the old CircularArray, their ElementCount is Count
+def isArray( obj ):
+    return obj.TypeId=='Part::FeaturePython' and \
+           hasattr(obj,'SourceObject') and hasattr(obj,'Count')
+
+
+# the arrayed object of an array: ( object, level, number of instances )
+# the source of an array is hidden, so nested arrays and links are resolved here
+def arraySource( obj, level ):
+    qty = obj.Count
+    src = obj.SourceObject
+    while src is not None and isArray(src):
+        qty *= src.Count
+        src = src.SourceObject
+    if src is not None and src.TypeId == 'App::Link':
+        if src.ElementCount > 0:
+            return ( src.LinkedObject, level, qty * src.ElementCount )
+        return ( src.LinkedObject, level+1, qty )
+    return ( src, level, qty )
+
+
+# the children of a container, in tree order
+def children( obj ):
+    doc = obj.Document
+    subs = []
+    for objName in obj.getSubObjects():
+        subObj = doc.getObject(objName[0:-1])
+        if subObj is not None:
+            subs.append(subObj)
+    return subs
+
+
+
+"""
+    +-----------------------------------------------+
+    |                 the BOM engine                |
+    +-----------------------------------------------+
+"""
+class bomEngine():
+
+    # autofill(obj) is called for parts that don't have the part info properties yet
+    # cache is a bomCache for the sub-assemblies, or None
+    def __init__(self, infoKeysUser=None, followSubassemblies=True, autofill=None, cache=None):
+        self.infoKeys = infoKeysUser if infoKeysUser is not None else loadInfoKeys()
+        self.followSubassemblies = followSubassemblies
+        self.maxLevel = maxLevel if followSubassemblies else localMaxLevel
+        self.autofill = autofill
+        self.cache = cache
+        # (document, label) -> row
+        self.rows = {}
+        # (document, label) -> ( row without quantity, kind, name of the first object )
+        self.found = {}
+        # the text report, joined at the end
+        self.log = []
+
+
+    # what an object contributes to the BOM at a given level:
+    # its own kind (or None) and the ( child, level, multiplicity ) below it
+    def expand(self, obj, level):
+        kind = None
+        subs = []
+        inRange = 0 < level <= self.maxLevel
+        # a visible App::Link, an array of links counts its linked object ElementCount times
+        if obj.TypeId == 'App::Link':
+            if obj.Visibility:
+                if obj.ElementCount > 0:
+                    subs = [ (obj.LinkedObject, level, obj.ElementCount) ]
+                else:
+                    subs = [ (obj.LinkedObject, level+1, 1) ]
+        # an Asm4 assembly is only listed in the local BOM
+        elif obj.TypeId == 'App::Part' and isAsm4Model(obj):
+            if inRange and not self.followSubassemblies:
+                kind = ASM4_PART
+            subs = [ (o, level+1, 1) for o in children(obj) ]
+        elif obj.TypeId == 'App::Part':
+            if inRange:
+                kind = PART
+            subs = [ (o, level+1, 1) for o in children(obj) ]
+        elif obj.TypeId == 'PartDesign::Body':
+            if inRange:
+                kind = PARTDESIGN
+        elif isFastener(obj):
+            if inRange:
+                # an orthogonal array of fasteners
+                if hasattr(obj, 'NumberX') and hasattr(obj, 'Base'):
+                    total = obj.NumberX * obj.NumberY * obj.NumberZ
+                    base  = getattr(obj.Base, 'LinkedObject', obj.Base)
+                    subs  = [ (base, level, total) ]
+                else:
+                    kind = FASTENER
+        # an Asm4 array (ExpressionArray, CircularArray ...)
+        elif isArray(obj):
+            if obj.Visibility:
+                subs = [ arraySource(obj, level) ]
+        elif obj.TypeId == 'App::DocumentObjectGroup':
+            subs = [ (o, level, 1) for o in children(obj) ]
+        return ( kind, [ s for s in subs if s[0] is not None ] )
+
+
+    # the sub-BOM of every distinct ( object, level ) is computed only once,
+    # and added to its parents' multiplied by the number of instances
+    # generates ( (document, label), quantity ) in tree order
+    def walk(self, root):
+        # ( object name, level ) -> { (document, label) : quantity }
+        subBOMs = {}
+        # ( object name, level ) -> the files the sub-BOM comes from
+        depends = {}
+        # ( object name, level ) -> expand()
+        expanded = {}
+        stack = [ (root, 0, False) ]
+        while stack:
+            (obj, level, done) = stack.pop()
+            node = (obj.FullName, level)
+            cacheable = self.cache is not None and self.isSubassembly(obj, level, root)
+            if not done:
+                # already computed, or being computed (a cyclic link)
+                if node in subBOMs or node in expanded:
+                    continue
+                # an unchanged sub-assembly file is a lookup
+                if cacheable:
+                    cached = self.cache.lookup(obj.Document, self.cacheTag())
+                    if cached is not None:
+                        (subBOMs[node], found, depends[node]) = cached
+                        for key, entry in found.items():
+                            self.found.setdefault(key, entry)
+                        self.log.append('> {}\n- sub-assembly from the BOM cache\n\n'.format(obj.Document.FileName))
+                        continue
+                expanded[node] = self.expand(obj, level)
+                stack.append( (obj, level, True) )
+                # the stack is LIFO
+                for (sub, subLevel, qty) in reversed(expanded[node][1]):
+                    stack.append( (sub, subLevel, False) )
+                continue
+            # all the children are done, sum them up
+            (kind, subs) = expanded[node]
+            bom = {}
+            deps = set( [obj.Document.FileName] )
+            if kind:
+                key = self.keyOf(obj, kind)
+                # the row is built for the first instance only
+                if key not in self.found:
+                    self.found[key] = ( self.makeRow(obj, kind, key), kind, obj.FullName )
+                bom[key] = 1
+            for (sub, subLevel, qty) in subs:
+                subNode = (sub.FullName, subLevel)
+                for key, subQty in subBOMs.get(subNode, {}).items():
+                    bom[key] = bom.get(key, 0) + qty * subQty
+                deps.update( depends.get(subNode, []) )
+            subBOMs[node] = bom
+            depends[node] = deps
+            if cacheable:
+                found = dict( [ (key, self.found[key]) for key in bom ] )
+                self.cache.store(obj.Document, self.cacheTag(), bom, found, deps)
+        for key, qty in subBOMs[ (root.FullName, 0) ].items():
+            yield ( key, qty )
+
+
+    # the assembly of a file, its sub-BOM can be cached:
+    # the assembly of another file, or the root itself
+    def isSubassembly(self, obj, level, root):
+        return self.followSubassemblies and isAsm4Model(obj) and obj.Document.FileName != '' \
+               and ( obj is root or (level > 0 and obj.Document is not root.Document) )
+
+
+    # the cached rows depend on the part info keys
+    def cacheTag(self):
+        return json.dumps(self.infoKeys, sort_keys=True)
+
+
+    # the aggregation key of a counted object: (document, label)
+    def keyOf(self, obj, kind):
+        if kind == FASTENER:
+            docName = os.path.splitext(os.path.basename(obj.Document.FileName))[0]
+            return ( docName, re.sub(r'[0-9]+$', '', obj.Label) )
+        elif kind == PARTDESIGN:
+            return ( obj.Document.Name, obj.Label )
+        docName = obj.Document.Name
+        if self.isActive('Document'):
+            # without a PartInfo property, getattr() finds the App document
+            value = getattr(obj, self.userData('Document'), docName)
+            if isinstance(value, str):
+                docName = value
+        label = obj.Label
+        if self.isActive('Part_Label'):
+            label = getattr(obj, self.userData('Part_Label'), label)
+        # the name cannot be Model otherwise it will sum all other 'Model' names together
+        if label == 'Model':
+            label = obj.Document.Name
+        return ( docName, label )
+
+
+    # the row of a counted object, only built for its first instance
+    def makeRow(self, obj, kind, key):
+        if kind == FASTENER:
+            return self.fastenerRow(obj, key)
+        elif kind == PARTDESIGN:
+            return self.bodyRow(obj)
+        return self.partRow(obj, key)
+
+
+    def userData(self, prop):
+        return self.infoKeys.get(prop).get('userData')
+
+    def isActive(self, prop):
+        return prop in self.infoKeys and self.infoKeys.get(prop).get('active')
+
+
+    def partRow(self, obj, key):
+        row = dict()
+        for prop in self.infoKeys:
+            if not self.isActive(prop):
+                continue
+            ud = self.userData(prop)
+            if not hasattr(obj, ud) and self.autofill:
+                self.autofill(obj)
+            if self.infoKeys.get(prop).get('visible'):
+                data = getattr(obj, ud, '-')
+            else:
+                data = '-'
+            if data == '':
+                data = '-'
+            if prop == 'Part_Label':
+                data = key[1]
+            elif prop == 'Document' and not isinstance(data, str):
+                data = key[0]
+            row[ud] = data
+        return row
+
+
+    def bodyRow(self, obj):
+        bodyProps = { 'Document': obj.Document.Label }
+        for prop in [ 'PartName', 'PartLength', 'PartWidth', 'PartHeight' ]:
+            bodyProps[prop] = getattr(obj, prop, '-')
+        row = dict()
+        for prop in self.infoKeys:
+            row[self.userData(prop)] = bodyProps.get(prop, '-')
+        return row
+
+
+    def fastenerRow(self, obj, key):
+        fastenerProps = { 'Document':          key[0],
+                          'Part_Label':        key[1],
+                          'Fastener_Diameter': getattr(obj, 'diameter', '-'),
+                          'Fastener_Type':     getattr(obj, 'type', '-') }
+        try:
+            fastenerProps['Fastener_Length'] = str(obj.length).strip('mm')
+        except AttributeError:
+            fastenerProps['Fastener_Length'] = ''
+        row = dict()
+        for prop in self.infoKeys:
+            row[self.userData(prop)] = fastenerProps.get(prop, '-')
+        return row
+
+
+    # walk the tree and aggregate the quantities
+    def build(self, root):
+        self.rows  = {}
+        self.found = {}
+        self.log   = []
+        for (key, qty) in self.walk(root):
+            self.count(key, qty)
+        self.log.append('\nBOM creation is done\n')
+        return self.rows
+
+
+    def count(self, key, qty=1):
+        (row, kind, objName) = self.found[key]
+        label = key[1]
+        if key in self.rows:
+            self.rows[key][qtyKey] += qty
+            self.log.append('> {} | {}: {}, {}\n- object already added ({})\n\n'.format(
+                            label, kind, label, objName, self.rows[key][qtyKey]))
+        else:
+            row = dict(row)
+            row[qtyKey] = qty
+            self.rows[key] = row
+            self.log.append('> {} | {}: {}, {}\n- adding object ({})\n'.format(
+                            label, kind, label, objName, qty))
+            for prop, data in row.items():
+                if prop != qtyKey and data != '-':
+                    self.log.append('- ' + prop + ': ' + str(data) + '\n')
+            self.log.append('\n')
+
+
+    # the column titles, in the order they first appear
+    def header(self):
+        columns = []
+        for row in self.rows.values():
+            for col in row:
+                if col not in columns:
+                    columns.append(col)
+        # the quantity is always last
+        if qtyKey in columns:
+            columns.remove(qtyKey)
+            columns.append(qtyKey)
+        return columns
+
+
+    def report(self):
+        return ''.join(self.log)
+
+
+
+"""
+    +-----------------------------------------------+
+    |     the on-disk cache of sub-assembly BOMs    |
+    +-----------------------------------------------+
+"""
+# the flattened BOM of a sub-assembly file is stored in a JSON file, together
+# with the modification state of every file it comes from. It stays valid across
+# sessions as long as none of these files has changed
+class bomCache():
+
+    def __init__(self, directory=cacheDir):
+        self.directory = directory
+        self.hits   = 0
+        self.misses = 0
+
+    def fileOf(self, path):
+        return os.path.join( self.directory, hashlib.sha1(path.encode('utf-8')).hexdigest()+'.json' )
+
+    # the modification state of a file, None if it is open with unsaved changes
+    def stamp(self, path):
+        for doc in App.listDocuments().values():
+            if doc.FileName == path and isModified(doc):
+                return None
+        try:
+            st = os.stat(path)
+        except OSError:
+            return None
+        return [ st.st_size, st.st_mtime_ns ]
+
+    # returns ( sub-BOM, rows, files ) or None
+    def lookup(self, doc, tag):
+        try:
+            with open(self.fileOf(doc.FileName), 'r') as cacheFile:
+                entry = json.load(cacheFile)
+        except (OSError, ValueError):
+            self.misses += 1
+            return None
+        valid = entry.get('version') == cacheVersion and entry.get('file') == doc.FileName \
+                and entry.get('tag') == tag
+        if valid:
+            for path, stamp in entry['depends'].items():
+                if self.stamp(path) != stamp:
+                    valid = False
+                    break
+        if not valid:
+            self.misses += 1
+            return None
+        self.hits += 1
+        bom   = {}
+        found = {}
+        for (docName, label, kind, objName, row, qty) in entry['rows']:
+            bom[ (docName, label) ] = qty
+            found[ (docName, label) ] = ( row, kind, objName )
+        return ( bom, found, set(entry['depends']) )
+
+    def store(self, doc, tag, bom, found, depends):
+        stamps = {}
+        for path in depends:
+            stamp = self.stamp(path)
+            # a file with unsaved changes can't be cached
+            if stamp is None:
+                return
+            stamps[path] = stamp
+        rows = []
+        for key, qty in bom.items():
+            (row, kind, objName) = found[key]
+            rows.append( [ key[0], key[1], kind, objName, row, qty ] )
+        entry = { 'version': cacheVersion, 'file': doc.FileName, 'tag': tag,
+                  'depends': stamps, 'rows': rows }
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            # other processes might be reading it, it is replaced at once
+            fileName = self.fileOf(doc.FileName)
+            with open(fileName+'.'+str(os.getpid()), 'w') as cacheFile:
+                # the property values that JSON doesn't know are stored as text
+                json.dump(entry, cacheFile, default=str)
+            os.replace(fileName+'.'+str(os.getpid()), fileName)
+        except OSError as err:
+            App.Console.PrintWarning('Could not write the BOM cache: '+str(err)+'\n')
+
+    def clear(self):
+        if os.path.isdir(self.directory):
+            for fileName in os.listdir(self.directory):
+                if fileName.endswith('.json'):
+                    os.remove( os.path.join(self.directory, fileName) )
+
+
+# whether a loaded document has changes that are not saved yet
+def isModified( doc ):
+    # only FreeCADGui knows about the unsaved changes, when it is there
+    if App.GuiUp:
+        import FreeCADGui as Gui
+        guiDoc = Gui.getDocument(doc.Name)
+        if guiDoc is not None and guiDoc.Modified:
+            return True
+    for obj in doc.Objects:
+        if obj.isTouched():
+            return True
+    return False
+
+
+# the cache, unless the user has disabled it
+def getCache():
+    if App.ParamGet(paramPath).GetBool('BomCache', True):
+        return bomCache()
+    return None
+
+
+
+"""
+    +-----------------------------------------------+
+    |       export the BOM without a spreadsheet    |
+    +-----------------------------------------------+
+"""
+# file extension -> format
+exportFormats = { '.csv'    : 'csv',
+                  '.jsonl'  : 'jsonl',
+                  '.ndjson' : 'jsonl',
+                  '.parquet': 'parquet' }
+
+# rows written at once to a Parquet file
+parquetBatch = 10000
+
+
+def formatOf( fileName ):
+    return exportFormats.get( os.path.splitext(fileName)[1].lower() )
+
+
+# the rows with all the columns of the header, one at a time
+def tableRows( rows, header ):
+    for row in rows.values():
+        yield [ row.get(col, '-') for col in header ]
+
+
+def exportCSV( rows, header, fileName ):
+    with open(fileName, 'w', newline='', encoding='utf-8') as csvFile:
+        writer = csv.writer(csvFile)
+        writer.writerow(header)
+        for values in tableRows(rows, header):
+            writer.writerow( [ str(v) for v in values ] )
+
+
+# one JSON object per line
+def exportJSONLines( rows, header, fileName ):
+    with open(fileName, 'w', encoding='utf-8') as jsonFile:
+        for values in tableRows(rows, header):
+            jsonFile.write( json.dumps( dict(zip(header, values)), default=str ) + '\n' )
+
+
+# columnar, pyarrow is optional
+def exportParquet( rows, header, fileName ):
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise RuntimeError('the Parquet export needs the pyarrow module')
+    # the quantity is an integer, everything else is text
+    fields = [ pa.field(col, pa.int64() if col == qtyKey else pa.string()) for col in header ]
+    schema = pa.schema(fields)
+    def batch( chunk ):
+        columns = []
+        for i, col in enumerate(header):
+            if col == qtyKey:
+                columns.append( pa.array( [ v[i] for v in chunk ], type=pa.int64() ) )
+            else:
+                columns.append( pa.array( [ str(v[i]) for v in chunk ], type=pa.string() ) )
+        return pa.RecordBatch.from_arrays( columns, schema=schema )
+    with pq.ParquetWriter(fileName, schema) as writer:
+        chunk = []
+        for values in tableRows(rows, header):
+            chunk.append(values)
+            if len(chunk) == parquetBatch:
+                writer.write_batch( batch(chunk) )
+                chunk = []
+        if chunk:
+            writer.write_batch( batch(chunk) )
+
+
+# write the BOM of a built engine, the format is guessed from the extension
+# returns the number of rows written
+def exportBOM( engine, fileName, fmt=None ):
+    if fmt is None:
+        fmt = formatOf(fileName)
+    header = engine.header()
+    if fmt == 'csv':
+        exportCSV( engine.rows, header, fileName )
+    elif fmt == 'jsonl':
+        exportJSONLines( engine.rows, header, fileName )
+    elif fmt == 'parquet':
+        exportParquet( engine.rows, header, fileName )
+    else:
+        raise ValueError('unknown BOM export format for '+fileName)
+    return len(engine.rows)
@@ -0,0 +1,194 @@
+#!/usr/bin/env python3
+# coding: utf-8
+#
+# Asm4_config.py
+#
+# LGPL
+# Copyright HUBERT Zoltán
+#
+# compact storage of configurations
+# this file must not import any GUI module
+#
+# instead of a spreadsheet with one row of text cells per object, the
+# configuration is an App::FeaturePython with the paths of the objects in a
+# string list and everything else packed in a single float list, which
+# FreeCAD saves in binary: per object
+#
+#   [ visible, type, x, y, z, q0, q1, q2, q3 ]
+#
+# the rotation is stored as a quaternion, so it keeps full double precision
+#
+# both storages are read into the same entries:
+#
+#   { object path : ( visible, assembly type, placement or None ) }
+
+
+
+import os
+
+import FreeCAD as App
+
+
+
+"""
+    +-----------------------------------------------+
+    |                 some definitions              |
+    +-----------------------------------------------+
+"""
+ASM4_CONFIG_DATA = 'Asm4::ConfigurationData'
+
+# the assembly types, their index is stored
+asmTypes = [ '-', 'Attacher', 'Asm4EE', 'Manual' ]
+
+# floats per object
+stride = 9
+
+iconFile = os.path.join( os.path.dirname(__file__), 'Resources/icons', 'Asm4_Configurations.svg' )
+
+
+
+"""
+    +-----------------------------------------------+
+    |          the configuration container          |
+    +-----------------------------------------------+
+"""
+class ConfigurationData( object ):
+
+    def __init__(self):
+        self.Object = None
+
+    def __getstate__(self):
+        return
+
+    def __setstate__(self,_state):
+        return
+
+    # new Python API called when the object is newly created
+    def attach(self, obj):
+        obj.addProperty('App::PropertyString',     'Type',        'Configuration', '')
+        obj.addProperty('App::PropertyString',     'Description', 'Configuration', 'Description of the configuration')
+        obj.addProperty('App::PropertyStringList', 'ObjectPaths', 'Configuration', 'Paths of the objects in the assembly')
+        obj.addProperty('App::PropertyFloatList',  'Data',        'Configuration',
+                        'Visibility, assembly type, position and quaternion of each object')
+        obj.Type = ASM4_CONFIG_DATA
+        for prop in ('Type', 'ObjectPaths', 'Data'):
+            obj.setPropertyStatus(prop, 'ReadOnly')
+        self.Object = obj
+
+    def onDocumentRestored(self, obj):
+        self.Object = obj
+
+    def execute(self, obj):
+        return
+
+
+class ViewProviderConfiguration( object ):
+
+    def __init__(self, vobj):
+        vobj.Proxy = self
+        self.attach(vobj)
+
+    def attach(self, vobj):
+        self.ViewObject = vobj
+        self.Object = vobj.Object
+
+    def getIcon(self):
+        return iconFile
+
+    def __getstate__(self):
+        return None
+
+    def __setstate__(self, _state):
+        return None
+
+
+def makeConfig( group, name, description ):
+    conf = group.Document.addObject('App::FeaturePython', name, ConfigurationData(), None, True)
+    group.addObject(conf)
+    conf.Description = str(description)
+    if App.GuiUp:
+        ViewProviderConfiguration(conf.ViewObject)
+    return conf
+
+
+def isConfigData( obj ):
+    return obj is not None and obj.TypeId == 'App::FeaturePython' \
+           and getattr(obj, 'Type', '') == ASM4_CONFIG_DATA
+
+
+
+"""
+    +-----------------------------------------------+
+    |              pack / unpack entries            |
+    +-----------------------------------------------+
+"""
+def pack( visible, asmType, placement ):
+    if asmType not in asmTypes:
+        asmType = '-'
+    if placement is None:
+        placement = App.Placement()
+    base = placement.Base
+    q    = placement.Rotation.Q
+    return [ 1.0 if visible else 0.0, float(asmTypes.index(asmType)),
+             base.x, base.y, base.z, q[0], q[1], q[2], q[3] ]
+
+
+def unpack( values ):
+    visible = values[0] != 0.0
+    asmType = asmTypes[ int(values[1]) ] if 0 <= int(values[1]) < len(asmTypes) else '-'
+    placement = None
+    if asmType in ('Asm4EE', 'Manual'):
+        placement = App.Placement( App.Vector(values[2], values[3], values[4]),
+                                   App.Rotation(values[5], values[6], values[7], values[8]) )
+    return ( visible, asmType, placement )
+
+
+# the entries of a compact configuration, read at once
+def entries( conf ):
+    data  = conf.Data
+    paths = conf.ObjectPaths
+    result = {}
+    for i, path in enumerate(paths):
+        result[path] = unpack( data[ i*stride : (i+1)*stride ] )
+    return result
+
+
+# replace the content of a compact configuration, one write per property
+def store( conf, entries ):
+    paths = []
+    data  = []
+    for path, (visible, asmType, placement) in entries.items():
+        paths.append(path)
+        data.extend( pack(visible, asmType, placement) )
+    # ReadOnly is only for the property editor
+    conf.ObjectPaths = paths
+    conf.Data = data
+
+
+
+"""
+    +-----------------------------------------------+
+    |          differences between entries          |
+    +-----------------------------------------------+
+"""
+def samePlacement( a, b, tol=1e-9 ):
+    if a is None or b is None:
+        return a is None and b is None
+    return a.isSame(b, tol)
+
+
+def sameEntry( a, b, tol=1e-9 ):
+    return a[0] == b[0] and a[1] == b[1] and samePlacement(a[2], b[2], tol)
+
+
+# [ ( path, entry in a or None, entry in b or None ) ] for what differs, in the order of a then b
+def diff( a, b, tol=1e-9 ):
+    result = []
+    for path, entry in a.items():
+        other = b.get(path)
+        if other is None or not sameEntry(entry, other, tol):
+            result.append( (path, entry, other) )
+    for path, other in b.items():
+        if path not in a:
+            result.append( (path, None, other) )
+    return result
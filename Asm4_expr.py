@@ -0,0 +1,354 @@
+#!/usr/bin/env python3
+# coding: utf-8
+#
+# Asm4_expr.py
+#
+# LGPL
+# Copyright HUBERT Zoltán
+#
+# compile the expressions of expression arrays into Python
+# this file must not import any GUI module
+#
+# the expressions that depend on Index are translated once into Python code,
+# which is then evaluated for all the elements at once with numpy, or element
+# by element without it. Only the simple syntax is handled: numbers with
+# mm / deg units, arithmetics, comparisons, a ? b : c, the usual functions,
+# Index, the other expressions and numerical properties of the array.
+# Anything else raises Unsupported, and the array is left to FreeCAD's own
+# evaluator:
+#
+#   evaluator = Asm4_expr.indexEvaluator( [('.Placer.Rotation.Angle', 'AngleStep * Index')],
+#                                         isConstant = lambda name: hasattr(obj, name) )
+#   values = evaluator.evaluate( obj.Count, constant = lambda name: getattr(obj, name) )
+
+
+
+import re, math
+
+# numpy is optional, all the elements are evaluated at once with it
+try:
+    import numpy
+    hasNumpy = True
+except ImportError:
+    hasNumpy = False
+
+
+
+"""
+    +-----------------------------------------------+
+    |                 some definitions              |
+    +-----------------------------------------------+
+"""
+class Unsupported(Exception):
+    pass
+
+
+# the factor to the unit of the property value: mm and degrees
+units = { 'mm': 1.0, 'cm': 10.0, 'm': 1000.0, 'deg': 1.0, '°': 1.0 }
+
+# the trigonometric functions of expressions work in degrees
+scalarFunctions = {
+    'sin':   lambda x: math.sin(math.radians(x)),
+    'cos':   lambda x: math.cos(math.radians(x)),
+    'tan':   lambda x: math.tan(math.radians(x)),
+    'asin':  lambda x: math.degrees(math.asin(x)),
+    'acos':  lambda x: math.degrees(math.acos(x)),
+    'atan':  lambda x: math.degrees(math.atan(x)),
+    'atan2': lambda y, x: math.degrees(math.atan2(y, x)),
+    'abs':   abs,
+    'sqrt':  math.sqrt,
+    'exp':   math.exp,
+    'log':   math.log,
+    'log10': math.log10,
+    'floor': math.floor,
+    'ceil':  math.ceil,
+    'trunc': math.trunc,
+    'pow':   math.pow,
+    'mod':   math.fmod,
+}
+
+if hasNumpy:
+    vectorFunctions = {
+        'sin':   lambda x: numpy.sin(numpy.radians(x)),
+        'cos':   lambda x: numpy.cos(numpy.radians(x)),
+        'tan':   lambda x: numpy.tan(numpy.radians(x)),
+        'asin':  lambda x: numpy.degrees(numpy.arcsin(x)),
+        'acos':  lambda x: numpy.degrees(numpy.arccos(x)),
+        'atan':  lambda x: numpy.degrees(numpy.arctan(x)),
+        'atan2': lambda y, x: numpy.degrees(numpy.arctan2(y, x)),
+        'abs':   numpy.abs,
+        'sqrt':  numpy.sqrt,
+        'exp':   numpy.exp,
+        'log':   numpy.log,
+        'log10': numpy.log10,
+        'floor': numpy.floor,
+        'ceil':  numpy.ceil,
+        'trunc': numpy.trunc,
+        'pow':   numpy.power,
+        'mod':   numpy.fmod,
+    }
+
+_token = re.compile( r'\s*(?:'
+                     r'(?P<num>(?:\d+\.?\d*|\.\d+)(?:[eE][-+]?\d+)?)'
+                     r'|(?P<name>\.?[A-Za-z_]\w*(?:\.[A-Za-z_]\w*)*)'
+                     r'|(?P<op>==|!=|<=|>=|[-+*/%^()?:<>,°]))' )
+
+_comparisons = ('==', '!=', '<', '>', '<=', '>=')
+
+
+
+"""
+    +-----------------------------------------------+
+    |       translation of an expression            |
+    +-----------------------------------------------+
+"""
+def tokenize( expression ):
+    tokens = []
+    pos = 0
+    expression = expression.rstrip()
+    while pos < len(expression):
+        match = _token.match(expression, pos)
+        if not match:
+            raise Unsupported(expression[pos:])
+        kind = match.lastgroup
+        tokens.append( (kind, match.group(kind)) )
+        pos = match.end()
+    return tokens
+
+
+# recursive descent with the precedence of FreeCAD's expressions
+# resolve(name) gives the Python variable of a name of the expression
+class translator():
+
+    def __init__(self, expression, resolve, vectorized):
+        self.tokens  = tokenize(expression)
+        self.pos     = 0
+        self.resolve = resolve
+        self.vectorized = vectorized
+        self.powered = False
+
+    def peek(self):
+        return self.tokens[self.pos][1] if self.pos < len(self.tokens) else None
+
+    def take(self, expected=None):
+        if self.pos >= len(self.tokens):
+            raise Unsupported('unexpected end')
+        (kind, value) = self.tokens[self.pos]
+        if expected is not None and value != expected:
+            raise Unsupported(value)
+        self.pos += 1
+        return (kind, value)
+
+    def translate(self):
+        code = self.ternary()
+        if self.pos != len(self.tokens):
+            raise Unsupported(self.peek())
+        return code
+
+    def ternary(self):
+        cond = self.comparison()
+        if self.peek() != '?':
+            return cond
+        self.take('?')
+        a = self.ternary()
+        self.take(':')
+        b = self.ternary()
+        if self.vectorized:
+            return '_where({}, {}, {})'.format(cond, a, b)
+        return '(({}) if ({}) else ({}))'.format(a, cond, b)
+
+    def comparison(self):
+        a = self.additive()
+        while self.peek() in _comparisons:
+            op = self.take()[1]
+            a = '({} {} {})'.format(a, op, self.additive())
+        return a
+
+    def additive(self):
+        a = self.multiplicative()
+        while self.peek() in ('+', '-'):
+            op = self.take()[1]
+            a = '({} {} {})'.format(a, op, self.multiplicative())
+        return a
+
+    def multiplicative(self):
+        a = self.unary()
+        while self.peek() in ('*', '/', '%'):
+            op = self.take()[1]
+            b = self.unary()
+            # the modulo of FreeCAD keeps the sign of the dividend
+            a = '_f_mod({}, {})'.format(a, b) if op == '%' else '({} {} {})'.format(a, op, b)
+        return a
+
+    # -a^b and a^b^c are left to FreeCAD, their precedence is ambiguous
+    def unary(self):
+        if self.peek() in ('-', '+'):
+            op = self.take()[1]
+            a = self.unary()
+            if self.powered:
+                raise Unsupported('^')
+            return '({}{})'.format(op, a)
+        return self.power()
+
+    # self.powered tells if the last operand was a power
+    def power(self):
+        a = self.primary()
+        self.powered = False
+        if self.peek() != '^':
+            return a
+        self.take('^')
+        b = self.unary()
+        if self.powered or self.peek() == '^':
+            raise Unsupported('^')
+        self.powered = True
+        return '({} ** {})'.format(a, b)
+
+    def primary(self):
+        (kind, value) = self.take()
+        if kind == 'num':
+            factor = 1.0
+            if self.peek() in units:
+                factor = units[self.take()[1]]
+            elif self.pos < len(self.tokens) and self.tokens[self.pos][0] == 'name':
+                # another unit
+                raise Unsupported(self.peek())
+            return repr(float(value) * factor)
+        if value == '(':
+            a = self.ternary()
+            self.take(')')
+            return '({})'.format(a)
+        if kind == 'name':
+            if self.peek() == '(':
+                if value not in scalarFunctions:
+                    raise Unsupported(value)
+                self.take('(')
+                args = [ self.ternary() ]
+                while self.peek() == ',':
+                    self.take(',')
+                    args.append( self.ternary() )
+                self.take(')')
+                return '_f_{}({})'.format(value, ', '.join(args))
+            return self.resolve(value)
+        raise Unsupported(value)
+
+
+
+"""
+    +-----------------------------------------------+
+    |     the expressions of an array, compiled     |
+    +-----------------------------------------------+
+"""
+class indexEvaluator():
+
+    # expressions: [ ( path, expression ) ] in the order of evaluation
+    # isConstant(name) tells if a name is a numerical property of the array
+    def __init__(self, expressions, isConstant):
+        self.paths = [ path for (path, expression) in expressions ]
+        # name -> Python variable
+        self.variables = { 'Index': 'Index' }
+        self.constants = {}
+        self.scalarCode = []
+        self.vectorCode = []
+        for i, (path, expression) in enumerate(expressions):
+            def resolve(name):
+                name = name.lstrip('.')
+                if name in self.variables:
+                    return self.variables[name]
+                if '.' not in name and isConstant(name):
+                    self.constants[name] = '_c{}'.format(len(self.constants))
+                    self.variables[name] = self.constants[name]
+                    return self.constants[name]
+                raise Unsupported(name)
+            scalar = translator(expression, resolve, False).translate()
+            self.scalarCode.append( compile(scalar, path, 'eval') )
+            if hasNumpy:
+                vector = translator(expression, resolve, True).translate()
+                self.vectorCode.append( compile(vector, path, 'eval') )
+            # the following expressions can use this one
+            self.variables[path.lstrip('.')] = '_v{}'.format(i)
+
+    # path -> [ value of each element ], constant(name) gives the value of a property
+    def evaluate(self, count, constant):
+        namespace = {}
+        for name, variable in self.constants.items():
+            value = constant(name)
+            # quantities are in mm and degrees
+            namespace[variable] = float(getattr(value, 'Value', value))
+        if hasNumpy:
+            try:
+                return self.evaluateVectors(count, dict(namespace))
+            # both sides of a ? b : c are evaluated, one of them can fail where it isn't used
+            except FloatingPointError:
+                pass
+        return self.evaluateScalars(count, namespace)
+
+    # all the elements at once
+    def evaluateVectors(self, count, namespace):
+        namespace.update( { '_f_'+name: func for name, func in vectorFunctions.items() } )
+        namespace['_where'] = numpy.where
+        namespace['Index']  = numpy.arange(count, dtype=float)
+        result = {}
+        with numpy.errstate(all='raise'):
+            for i, code in enumerate(self.vectorCode):
+                value = eval(code, namespace)
+                value = numpy.broadcast_to( numpy.asarray(value, dtype=float), (count,) )
+                namespace['_v{}'.format(i)] = value
+                result[self.paths[i]] = value.tolist()
+        return result
+
+    def evaluateScalars(self, count, namespace):
+        namespace.update( { '_f_'+name: func for name, func in scalarFunctions.items() } )
+        result = { path: [] for path in self.paths }
+        for index in range(count):
+            namespace['Index'] = index
+            for i, code in enumerate(self.scalarCode):
+                value = float(eval(code, namespace))
+                namespace['_v{}'.format(i)] = value
+                result[self.paths[i]].append(value)
+        return result
+
+
+
+"""
+    +-----------------------------------------------+
+    |     the placements of all the elements        |
+    +-----------------------------------------------+
+"""
+# quaternions are ( x, y, z, w ) like App.Rotation.Q, in arrays of shape (n,4)
+def quaternionProduct( p, q ):
+    (px, py, pz, pw) = ( p[:,0], p[:,1], p[:,2], p[:,3] )
+    (qx, qy, qz, qw) = ( q[:,0], q[:,1], q[:,2], q[:,3] )
+    return numpy.stack( ( pw*qx + px*qw + py*qz - pz*qy,
+                          pw*qy - px*qz + py*qw + pz*qx,
+                          pw*qz + px*qy - py*qx + pz*qw,
+                          pw*qw - px*qx - py*qy - pz*qz ), axis=1 )
+
+
+# the vectors v (n,3) rotated by the quaternions q (n,4)
+def quaternionRotate( q, v ):
+    u = q[:,:3]
+    t = 2.0 * numpy.cross(u, v)
+    return v + q[:,3:4] * t + numpy.cross(u, t)
+
+
+# axisPlacement * Placement( base, Rotation(axis, angle) ) * placement for all the elements
+# at once, the placements are ( position, quaternion ) and the angles in degrees
+# returns the positions (n,3) and quaternions (n,4), or None if an axis is null
+def elementPlacements( axisPlacement, placement, bases, axes, angles ):
+    axes  = numpy.asarray(axes,  dtype=float)
+    bases = numpy.asarray(bases, dtype=float)
+    norms = numpy.linalg.norm(axes, axis=1)
+    if not numpy.all(norms > 0.0):
+        return None
+    half = numpy.radians( numpy.asarray(angles, dtype=float) ) / 2.0
+    rotations = numpy.concatenate( ( axes * (numpy.sin(half) / norms)[:,None],
+                                     numpy.cos(half)[:,None] ), axis=1 )
+    n = len(rotations)
+    (axisBase, axisQ)  = ( numpy.tile(numpy.asarray(axisPlacement[0], dtype=float), (n,1)),
+                           numpy.tile(numpy.asarray(axisPlacement[1], dtype=float), (n,1)) )
+    (base, q) = ( numpy.tile(numpy.asarray(placement[0], dtype=float), (n,1)),
+                  numpy.tile(numpy.asarray(placement[1], dtype=float), (n,1)) )
+    # (r, b) * (q, p) = (r q, b + r p)
+    positions = axisBase + quaternionRotate( axisQ, bases + quaternionRotate(rotations, base) )
+    quaternions = quaternionProduct( axisQ, quaternionProduct(rotations, q) )
+    return positions, quaternions
@@ -0,0 +1,354 @@
+#!/usr/bin/env python3
+# coding: utf-8
+#
+# Asm4_fcstd.py
+#
+# LGPL
+# Copyright HUBERT Zoltán
+#
+# read the structure of FCStd files without opening them in FreeCAD
+# this file must not import any GUI module, nor FreeCAD itself
+#
+# only the Document.xml inside the FCStd zip is parsed: object types, labels,
+# simple properties (strings, numbers, booleans, enumerations) and links.
+# No shape is loaded, so listing the parts of a product with hundreds of files
+# takes a fraction of the memory of opening them. The objects read here have
+# the same attributes as the FreeCAD ones for what Asm4_bom and the tree of
+# linked files use, so they can be given to them instead:
+#
+#   reader = Asm4_fcstd.fileReader()
+#   assy = reader.open('product.FCStd').findAssembly()
+#   Asm4_bom.bomEngine().build(assy)
+
+
+
+import os, zipfile
+import xml.etree.ElementTree as ET
+
+
+
+# the properties of App::Link that might not be in the file
+linkDefaults = { 'ElementCount': 0, 'LinkedObject': None }
+
+
+
+"""
+    +-----------------------------------------------+
+    |             an object of the file             |
+    +-----------------------------------------------+
+"""
+class fileObject():
+
+    def __init__(self, document, name, typeId):
+        self.Document = document
+        self.Name     = name
+        self.TypeId   = typeId
+        self.FullName = document.Name + '#' + name
+        # property -> value, links are resolved when they are read
+        self.properties = {}
+
+    # the properties are read like those of FreeCAD objects
+    def __getattr__(self, prop):
+        # don't look for properties before they are there
+        if prop in ('properties', 'Document'):
+            raise AttributeError(prop)
+        # the XML isn't kept, only the module of the proxy is needed (Asm4_bom.isFastener)
+        if prop == 'Content':
+            proxy = self.properties.get('Proxy', '')
+            return proxy if isinstance(proxy, str) else ''
+        if prop not in self.properties:
+            # older files don't always store the default values
+            if self.TypeId == 'App::Link' and prop in linkDefaults:
+                return linkDefaults[prop]
+            raise AttributeError(prop)
+        return self.Document.resolve( self.properties[prop] )
+
+    @property
+    def Label(self):
+        return self.properties.get('Label', self.Name)
+
+    @property
+    def Visibility(self):
+        return self.properties.get('Visibility', True)
+
+    def isDerivedFrom(self, typeId):
+        return self.TypeId == typeId or typeId == 'App::DocumentObject'
+
+    def isValid(self):
+        return True
+
+    # the objects of the group, as Asm4_bom.children() expects them
+    def getSubObjects(self):
+        return [ obj.Name + '.' for obj in self.group() ]
+
+    def group(self):
+        if 'Group' in self.properties:
+            return [ obj for obj in self.Group if obj is not None ]
+        return []
+
+    # what the tree view shows under the object
+    def claimChildren(self):
+        if self.TypeId == 'App::Link':
+            linked = self.LinkedObject
+            return linked.claimChildren() if linked is not None else []
+        return self.group()
+
+
+
+"""
+    +-----------------------------------------------+
+    |                 a FCStd file                  |
+    +-----------------------------------------------+
+"""
+class fileDocument():
+
+    def __init__(self, reader, path):
+        self.reader   = reader
+        self.FileName = path
+        self.Name     = os.path.splitext(os.path.basename(path))[0]
+        self.Label    = self.Name
+        # name -> fileObject, in the order of the file
+        self.objects  = {}
+        self.read()
+
+    @property
+    def Objects(self):
+        return list(self.objects.values())
+
+    def getObject(self, name):
+        return self.objects.get(name)
+
+    # same as Asm4_solver.findAssembly()
+    def findAssembly(self):
+        assy = self.getObject('Assembly')
+        if assy is not None and assy.TypeId == 'App::Part' and getattr(assy, 'Type', '') == 'Assembly':
+            return assy
+        model = self.getObject('Model')
+        if model is not None and model.TypeId == 'App::Part':
+            return model
+        return None
+
+    # the files this one links to
+    def linkedFiles(self):
+        files = set()
+        for obj in self.objects.values():
+            for value in obj.properties.values():
+                for link in linksIn(value):
+                    if link[1]:
+                        files.add( self.filePath(link[1]) )
+        files.discard(self.FileName)
+        return sorted(files)
+
+    def filePath(self, fileName):
+        if os.path.isabs(fileName):
+            return os.path.normpath(fileName)
+        return os.path.normpath( os.path.join(os.path.dirname(self.FileName), fileName) )
+
+    # the object a ( 'link', file, name ) value points to, other values are returned as is
+    def resolve(self, value):
+        if isinstance(value, tuple) and value and value[0] == 'link':
+            (tag, fileName, name) = value
+            doc = self
+            if fileName:
+                doc = self.reader.open( self.filePath(fileName) )
+                if doc is None:
+                    return None
+            return doc.getObject(name)
+        if isinstance(value, list):
+            return [ self.resolve(v) for v in value ]
+        return value
+
+
+    def read(self):
+        with zipfile.ZipFile(self.FileName) as fcstd:
+            with fcstd.open('Document.xml') as xml:
+                root = ET.parse(xml).getroot()
+        # the document's own properties
+        docProps = root.find('Properties')
+        if docProps is not None:
+            self.Label = readProperties(docProps).get('Label', self.Name)
+        objects = root.find('Objects')
+        if objects is not None:
+            for elem in objects.findall('Object'):
+                name = elem.get('name')
+                self.objects[name] = fileObject(self, name, elem.get('type'))
+        data = root.find('ObjectData')
+        if data is not None:
+            for elem in data.findall('Object'):
+                obj = self.objects.get(elem.get('name'))
+                if obj is None:
+                    continue
+                props = elem.find('Properties')
+                if props is not None:
+                    obj.properties = readProperties(props)
+
+
+
+"""
+    +-----------------------------------------------+
+    |         the values of the properties          |
+    +-----------------------------------------------+
+"""
+# name -> value of the properties that can be read without FreeCAD
+def readProperties( propsElem ):
+    props = {}
+    for prop in propsElem.findall('Property'):
+        value = readValue(prop)
+        if value is not None:
+            props[prop.get('name')] = value
+    return props
+
+
+def readValue( prop ):
+    children = list(prop)
+    if not children:
+        return None
+    elem = children[0]
+    tag = elem.tag
+    if tag == 'String':
+        return elem.get('value', '')
+    elif tag == 'Bool':
+        return elem.get('value') == 'true'
+    elif tag == 'Integer':
+        # an enumeration with its own list of items
+        enums = prop.find('CustomEnumList')
+        if enums is not None:
+            items = [ e.get('value') for e in enums.findall('Enum') ]
+            index = int(elem.get('value'))
+            return items[index] if 0 <= index < len(items) else ''
+        return int(elem.get('value'))
+    elif tag == 'Float':
+        return float(elem.get('value'))
+    elif tag == 'Link':
+        name = elem.get('value', '')
+        return ('link', '', name) if name else None
+    elif tag == 'XLink':
+        name = elem.get('name', '')
+        return ('link', elem.get('file', ''), name) if name else None
+    elif tag == 'LinkList':
+        return [ ('link', '', l.get('value')) for l in elem.findall('Link') ]
+    elif tag == 'XLinkList':
+        return [ ('link', l.get('file', ''), l.get('name')) for l in elem.findall('XLink') ]
+    elif tag == 'Python':
+        # a proxy, only its module is useful
+        return elem.get('module', '')
+    return None
+
+
+# the links in a property value
+def linksIn( value ):
+    if isinstance(value, tuple) and value and value[0] == 'link':
+        return [ value ]
+    if isinstance(value, list):
+        return [ v for v in value if isinstance(v, tuple) and v and v[0] == 'link' ]
+    return []
+
+
+
+"""
+    +-----------------------------------------------+
+    |     the files, each one read only once        |
+    +-----------------------------------------------+
+"""
+class fileReader():
+
+    def __init__(self):
+        # path -> fileDocument, or None if it can't be read
+        self.documents = {}
+
+    def open(self, path):
+        path = os.path.normpath(os.path.abspath(path))
+        if path not in self.documents:
+            try:
+                self.documents[path] = fileDocument(self, path)
+            except (OSError, KeyError, zipfile.BadZipFile, ET.ParseError):
+                self.documents[path] = None
+        return self.documents[path]
+
+
+
+"""
+    +-----------------------------------------------+
+    |       the tree of linked files as text        |
+    +-----------------------------------------------+
+"""
+# the types of objects listed in the tree, links are listed too
+treeTypes = [ 'App::Part', 'PartDesign::Body', 'Part::FeaturePython', 'App::DocumentObjectGroup' ]
+
+# visual ASCII art: ( tab, branch, fork, last )
+treeStyle = ( '    ', ' │  ', ' ├─ ', ' └─ ' )
+
+
+# the children shown in the tree view: FreeCAD objects ask their ViewObject
+def claimChildren( obj ):
+    viewObject = getattr(obj, 'ViewObject', None)
+    if viewObject is not None:
+        return viewObject.claimChildren()
+    return obj.claimChildren()
+
+
+# works with FreeCAD objects as well as with those of fileReader
+def asciiTree( objs, rootPath='', types=treeTypes, style=treeStyle ):
+    (TAB, BRANCH, FORK, LAST) = style
+    lines = []
+    # ( objects, index, level, baseline ), the stack replaces the recursion
+    stack = [ (objs, 0, 0, '') ]
+    while stack:
+        (siblings, index, level, baseline) = stack.pop()
+        if index >= len(siblings):
+            continue
+        obj = siblings[index]
+        # the next sibling comes after the children of this one
+        stack.append( (siblings, index+1, level, baseline) )
+        isLink = obj.isDerivedFrom('App::Link')
+        target = obj.LinkedObject if isLink else obj
+        if target is None:
+            target = obj
+        # try relative filepath, else absolute
+        filepath = ''
+        if rootPath:
+            filepath = target.Document.FileName.partition(rootPath)[2]
+        if filepath == '':
+            filepath = target.Document.FileName
+        data = {
+            "LBL"  : obj.Label,
+            "NAME" : '('+obj.Name+')' if obj.Label!=obj.Name else '',
+            "DOC"  : filepath,
+            "TARG" : target.Name if isLink else ''
+        }
+        last = index == len(siblings) - 1
+        line = ''
+        if last:
+            if level > 0:
+                line += baseline + LAST
+        else:
+            line += baseline + FORK
+        if isLink:
+            line += '{LBL} => {TARG} @ {DOC}'.format(**data)
+        else:
+            line += '{LBL} {NAME}'.format(**data)
+        # we add the filename for the first element
+        if level == 0 and target.Document.FileName != '':
+            line += ' @ '+target.Document.FileName
+        lines.append(line)
+        # for the next line
+        if last:
+            baselineNext = baseline + TAB if level > 0 else ''
+        else:
+            baselineNext = baseline + BRANCH
+        children = [ child for child in claimChildren(obj)
+                     if child.TypeId in types or child.isDerivedFrom('App::Link') ]
+        stack.append( (children, 0, level+1, baselineNext) )
+    return ''.join( line+'\n' for line in lines )
+
+
+# the tree of the assembly of a file, without opening it
+def fileTree( path, reader=None ):
+    if reader is None:
+        reader = fileReader()
+    doc = reader.open(path)
+    if doc is None:
+        return ''
+    assy = doc.findAssembly()
+    roots = [ assy ] if assy is not None else [ o for o in doc.Objects if o.TypeId == 'App::Part' ]
+    return asciiTree( roots, os.path.dirname(doc.FileName) + os.sep )
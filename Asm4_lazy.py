@@ -0,0 +1,211 @@
+#!/usr/bin/env python3
+# coding: utf-8
+#
+# Asm4_lazy.py
+#
+# LGPL
+# Copyright HUBERT Zoltán
+#
+# lazy loading of the heavy command modules
+# the workbench registers light stubs with only the command's resources,
+# the real module is imported the first time one of its commands is run.
+# Whoever imports the module, its commands are given to the stubs, which then
+# forward everything to them. The resources of the stubs are checked against
+# those of the real commands when they are loaded, checkLazyModules() checks
+# them all at once
+
+
+
+import os, sys, importlib
+
+import FreeCADGui as Gui
+import FreeCAD as App
+from FreeCAD import Console as FCC
+
+import Asm4_libs as Asm4
+
+
+
+"""
+    +-----------------------------------------------+
+    |   the commands of the lazily loaded modules   |
+    +-----------------------------------------------+
+"""
+# the tool tip of the commands inserting fasteners
+fastenerToolTip = ( '<p>Insert a {} into the Assembly</p>'
+                    '<p>If another fastener is selected, a new fastener of the same type is created in the same assembly.'
+                    'If an axis or LCS is selected, the new fastener will be attached to it.'
+                    'If an assembly is selected, the new fastener will be inside that assembly.</p>' )
+
+# module : { command : ( MenuText, ToolTip, icon, needs an assembly ) }
+# they must be those of the real commands, checkLazyModules() tells if they aren't
+lazyModules = {
+    'AnimationLib' : {
+        'Asm4_Animate'           : ( 'Animate Assembly', 'Animate Assembly',
+                                     'Asm4_GearsAnimate.svg', True ) },
+    'Asm4_Measure' : {
+        'Asm4_Measure'           : ( 'Measure', 'Measure Tool',
+                                     'Part_Measure.svg', False ) },
+    'makeBomCmd' : {
+        'Asm4_makeLocalBOM'      : ( 'Local Bill of Materials', 'Create the Bill of Materials of the Assembly',
+                                     'Asm4_PartsList.svg', True ),
+        'Asm4_makeBOM'           : ( 'Bill of Materials', 'Create the Bill of Materials of the Assembly including sub-assemblies',
+                                     'Asm4_PartsList_Subassemblies.svg', True ) },
+    'exportFiles' : {
+        'Asm4_listLinkedFiles'   : ( 'Tree of Linked Files',
+                                     '<p>Show the hierarchical tree structure of parts in the selected container. '
+                                     'The tree is displayed with ASCII art</p>'
+                                     '<p><b>Usage</b>: select an entity and click the command</p>',
+                                     'Asm4_List_Liked_Files_Tree.svg', False ) },
+    'configurationEngine' : {
+        'Asm4_applyConfiguration': ( 'Apply configuration', 'Applies selected configuration\nConfigurations allow to set visibilities and offsets of parts',
+                                     'Asm4_applyConfig.svg', True ),
+        'Asm4_openConfigurations': ( 'Open configurations panel', 'Configurations allow to set visibilities and offsets of parts',
+                                     'Asm4_Configurations.svg', True ),
+        'Asm4_newConfiguration'  : ( 'New configuration', 'Create a new configuration of the assembly',
+                                     'Asm4_applyConfig.svg', True ) },
+    'FastenersLib' : {
+        'Asm4_insertScrew'       : ( 'Insert Screw', fastenerToolTip.format('Screw'),
+                                     'Asm4_Screw.svg', False ),
+        'Asm4_insertNut'         : ( 'Insert Nut', fastenerToolTip.format('Nut'),
+                                     'Asm4_Nut.svg', False ),
+        'Asm4_insertWasher'      : ( 'Insert Washer', fastenerToolTip.format('Washer'),
+                                     'Asm4_Washer.svg', False ),
+        'Asm4_cloneFastenersToAxes': ( 'Clone Fastener to Axes', 'Clone Fastener to Axes',
+                                     'Asm4_cloneFasteners.svg', True ),
+        'Asm4_FSparameters'      : ( 'Change Fastener parameters', 'Change Fastener parameters',
+                                     'Asm4_FSparams.svg', False ) },
+    }
+
+# the registered stubs, by command name
+stubs = {}
+
+# the original Gui.addCommand, once it is hooked
+guiAddCommand = None
+
+
+
+"""
+    +-----------------------------------------------+
+    |          a stub for a lazy command            |
+    +-----------------------------------------------+
+"""
+class lazyCommand():
+
+    def __init__(self, name, moduleName, resources):
+        self.name       = name
+        self.moduleName = moduleName
+        self.resources  = resources
+        # the real command, once its module is loaded
+        self.command    = None
+
+    def GetResources(self):
+        if self.command:
+            return self.command.GetResources()
+        (menuText, toolTip, icon, needsAssembly) = self.resources
+        return {"MenuText": menuText,
+                "ToolTip" : toolTip,
+                "Pixmap"  : os.path.join( Asm4.iconPath, icon ) }
+
+    # until the module is loaded, only do a cheap check
+    def IsActive(self):
+        if self.command:
+            return self.command.IsActive()
+        if self.resources[3]:
+            return Asm4.getAssembly() is not None
+        return App.ActiveDocument is not None
+
+    def Activated(self, *args):
+        if not self.command:
+            loadModule(self.moduleName)
+        if not self.command:
+            FCC.PrintError('Could not load the command '+self.name+' from '+self.moduleName+'\n')
+            return
+        # the real command might not be active in this context
+        if self.command.IsActive():
+            return self.command.Activated(*args)
+        FCC.PrintMessage(self.GetResources()['MenuText']+' is not available in this context\n')
+
+    # the resources of the stub that differ from those of the real command
+    def differences(self):
+        if not self.command:
+            return []
+        real = self.command.GetResources()
+        (menuText, toolTip, icon, needsAssembly) = self.resources
+        result = []
+        if real.get('MenuText') != menuText:
+            result.append('MenuText')
+        if real.get('ToolTip') != toolTip:
+            result.append('ToolTip')
+        if os.path.basename(real.get('Pixmap', '')) != icon:
+            result.append('Pixmap')
+        return result
+
+
+
+"""
+    +-----------------------------------------------+
+    |        register the stubs / load a module     |
+    +-----------------------------------------------+
+"""
+def addLazyModule( moduleName ):
+    hookAddCommand()
+    for name, resources in lazyModules[moduleName].items():
+        stub = lazyCommand(name, moduleName, resources)
+        stubs[name] = stub
+        guiAddCommand( name, stub )
+
+
+# the commands of the lazy modules are given to their stubs instead of being registered,
+# whenever and by whoever the modules are imported
+def hookAddCommand():
+    global guiAddCommand
+    if guiAddCommand is not None:
+        return
+    guiAddCommand = Gui.addCommand
+    def captureCommand( name, command, *args ):
+        stub = stubs.get(name)
+        if stub is not None:
+            if stub.command is None:
+                stub.command = command
+                differences = stub.differences()
+                if differences:
+                    FCC.PrintWarning('Asm4_lazy: the resources of '+name+' differ from the command in '+stub.moduleName+': '+', '.join(differences)+'\n')
+        # Asm4 commands that the workbench has already defined (like drop-down menus)
+        elif not ( name.startswith('Asm4_') and name in Gui.listCommands() ):
+            guiAddCommand( name, command, *args )
+    Gui.addCommand = captureCommand
+
+
+# import the module, its commands go to the stubs
+def loadModule( moduleName ):
+    try:
+        # an already imported module has given its commands already
+        importlib.import_module( moduleName )
+    except Exception as err:
+        FCC.PrintError('Error loading '+moduleName+': '+str(err)+'\n')
+
+
+# the module, loaded through the stubs if it isn't yet
+def getModule( moduleName ):
+    if moduleName not in sys.modules:
+        loadModule( moduleName )
+    return sys.modules[moduleName]
+
+
+# load all the lazy modules and return { command : [ resources that differ from the stub ] }
+def checkLazyModules():
+    result = {}
+    for moduleName in lazyModules:
+        if not any( name in stubs for name in lazyModules[moduleName] ):
+            continue
+        loadModule( moduleName )
+        for name in lazyModules[moduleName]:
+            stub = stubs.get(name)
+            if stub is None:
+                continue
+            if stub.command is None:
+                result[name] = ['not loaded']
+            elif stub.differences():
+                result[name] = stub.differences()
+    return result
@@ -25,6 +25,8 @@ import FreeCADGui as Gui
 import FreeCAD as App
 from FreeCAD import Console as FCC
 
+import Asm4_solver
+
 
 
 # Types of datum objects
@@ -244,30 +246,11 @@ def checkWorkbench( workbench ):
     return hasWB
 
 # since Asm4 v0.20 an assembly is called "Assembly" again
+# this is called by most IsActive(), so the result is cached per document
+# and invalidated by the observer in Asm4_solver when the document's tree changes
 def getAssembly():
     # return checkModel()
-    retval = None
-    if App.ActiveDocument:
-        # the current (as per v0.90) assembly container
-        assy = App.ActiveDocument.getObject('Assembly')
-        if assy and assy.TypeId == 'App::Part'  \
-                and assy.Type   == 'Assembly'   \
-                and assy.getParentGeoFeatureGroup() is None:
-            retval = assy
-        else:
-            # former Asm4 Model compatibility check:
-            model = App.ActiveDocument.getObject('Model')
-            if model and model.TypeId == 'App::Part'  \
-                    and model.Type    == 'Assembly'   \
-                    and model.getParentGeoFeatureGroup() is None:
-                retval = model
-            else:
-                # last chance, very old Asm4 Model
-                if model and model.TypeId=='App::Part'  \
-                        and model.getParentGeoFeatureGroup() is None:
-                    FCC.PrintMessage("Deprecated Asm4 Model detected, this could lead to uncompatibilities\n")
-                    retval = model
-    return retval
+    return Asm4_solver.findAssembly( App.ActiveDocument )
 
 
 # checks and returns whether there is an Asm4 Assembly Model in the active document
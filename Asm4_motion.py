@@ -0,0 +1,131 @@
+#!/usr/bin/env python3
+# coding: utf-8
+#
+# Asm4_motion.py
+#
+# LGPL
+# Copyright HUBERT Zoltán
+#
+# motion between two configurations
+# the placements of all the frames are interpolated once, linearly for the
+# positions and with SLERP for the rotations, playing a frame only sets them
+# and updates the objects that depend on the moved ones
+#
+# it has the nextFrame() / pendulumWanted() interface of AnimationLib's
+# animationProvider, so it can be exported by AnimationExportLib:
+#
+#   motion = configurationEngine.motionBetween( 'Closed', 'Open', frames=100 )
+#   motion.play()
+
+
+
+import FreeCAD as App
+
+import Asm4_solver
+
+
+
+"""
+    +-----------------------------------------------+
+    |              the interpolation                |
+    +-----------------------------------------------+
+"""
+def interpolate( start, end, t ):
+    base = start.Base + (end.Base - start.Base) * t
+    rotation = start.Rotation.slerp(end.Rotation, t)
+    return App.Placement(base, rotation)
+
+
+
+"""
+    +-----------------------------------------------+
+    |        a motion between configurations        |
+    +-----------------------------------------------+
+"""
+class configurationMotion():
+
+    # start and end are configuration entries { path: ( visible, type, placement ) },
+    # objects gives the object of each path
+    def __init__(self, doc, start, end, objects, frames=50, pendulum=False):
+        self.doc      = doc
+        self.frames   = max(2, int(frames))
+        self.pendulum = pendulum
+        # ( object, property, [ placement of each frame ] )
+        self.tracks   = []
+        # ( object, visibility until the last frame, at the last frame )
+        self.visibilities = []
+        self.current  = 0
+        self.step     = 1
+        self.timer    = None
+        self.precompute(start, end, objects)
+
+    def precompute(self, start, end, objects):
+        for path, (endVisible, asmType, endPlacement) in end.items():
+            obj = objects.get(path)
+            if obj is None or path not in start:
+                continue
+            (startVisible, startType, startPlacement) = start[path]
+            if startVisible != endVisible:
+                self.visibilities.append( (obj, startVisible, endVisible) )
+            if startPlacement is None or endPlacement is None or startType != asmType:
+                continue
+            # the objects that don't move are left alone
+            if startPlacement.isSame(endPlacement, 1e-9):
+                continue
+            prop = 'AttachmentOffset' if asmType == 'Asm4EE' else 'Placement'
+            placements = [ interpolate(startPlacement, endPlacement, i / (self.frames-1))
+                           for i in range(self.frames) ]
+            self.tracks.append( (obj, prop, placements) )
+
+    def applyFrame(self, index):
+        moved = set()
+        for (obj, prop, placements) in self.tracks:
+            setattr(obj, prop, placements[index])
+            moved.add(obj.Name)
+        for (obj, startVisible, endVisible) in self.visibilities:
+            visible = endVisible if index == self.frames - 1 else startVisible
+            if obj.ViewObject.Visibility != visible:
+                obj.ViewObject.Visibility = visible
+        # the observer has seen our own changes
+        Asm4_solver.observer.popDirty(self.doc)
+        Asm4_solver.updateAssembly(self.doc, dirty=moved)
+
+    # animationProvider interface: returns True after the last frame
+    def nextFrame(self, resetAnimation) -> bool:
+        if resetAnimation:
+            self.current = 0
+        self.applyFrame(self.current)
+        self.current += 1
+        return self.current >= self.frames
+
+    def pendulumWanted(self) -> bool:
+        return self.pendulum
+
+
+    # play the motion in the GUI, back and forth until stop() if pendulum
+    def play(self, fps=25):
+        from PySide import QtCore
+        self.stop()
+        self.current = 0
+        self.step    = 1
+        self.timer   = QtCore.QTimer()
+        self.timer.timeout.connect(self.onTimerTick)
+        self.timer.start( int(1000 / fps) )
+
+    def onTimerTick(self):
+        import FreeCADGui as Gui
+        self.applyFrame(self.current)
+        Gui.updateGui()
+        nextFrame = self.current + self.step
+        if 0 <= nextFrame < self.frames:
+            self.current = nextFrame
+        elif self.pendulum:
+            self.step = -self.step
+            self.current += self.step
+        else:
+            self.stop()
+
+    def stop(self):
+        if self.timer is not None:
+            self.timer.stop()
+            self.timer = None
@@ -9,7 +9,7 @@
 
 
 import os
-from math import radians
+from math import radians, degrees
 import re
 
 from PySide import QtGui, QtCore
@@ -18,6 +18,7 @@ import FreeCAD as App
 from FreeCAD import Console as FCC
 
 import Asm4_libs as Asm4
+import Asm4_expr
 
 
 
@@ -452,6 +453,12 @@ class ExpressionArray(LinkArray):
         App.Console.PrintError(f'{type(self).__name__} {obj.Label}: {message}\n')
         raise RuntimeError
 
+    # a circular reference is reported once per array, until its expressions change
+    def reportCycle(self, obj, error):
+        if error and getattr(self, 'reportedCycle', None) != error:
+            App.Console.PrintError(f'{type(self).__name__} {obj.Label}: {error}\n')
+        self.reportedCycle = error
+
     def onDocumentRestored(self, obj):
         # for backwards compability
         if obj.getTypeIdOfProperty('Axis') == 'App::PropertyLink':
@@ -492,6 +499,13 @@ class ExpressionArray(LinkArray):
 
         super().onDocumentRestored(obj)
 
+    def onChanged(self, obj, prop):
+        super().onChanged(obj, prop)
+        # the evaluation order, and a circular reference, are found once per edit
+        if prop == 'ExpressionEngine':
+            (order, error) = _cachedEvalOrder(dict(obj.ExpressionEngine))
+            self.reportCycle(obj, error)
+
     # Set up the properties when the object is attached.
     def attach(self, obj):
         super().attach(obj)
@@ -542,11 +556,96 @@ class ExpressionArray(LinkArray):
             obj.AxisPlacement = obj.SourceObject.Placement
         # preparing calculations
         pmt1 = obj.AxisPlacement.inverse() * sObj.Placement
+        expDict = dict(obj.ExpressionEngine)
+        (evalList, error) = _cachedEvalOrder(expDict)
+        # a circular reference puts the array in error, it has been reported
+        # when the expressions were edited, or is now if it wasn't
+        if error:
+            self.reportCycle(obj, error)
+            raise RuntimeError
+        # the expressions compiled once to Python, FreeCAD evaluates what they don't support
+        values = self.compiledValues(obj, expDict, evalList)
+        if values is not None:
+            placementList, scaleList = self.compiledPlacements(obj, values, pmt1)
+        else:
+            placementList, scaleList = self.evaluatedPlacements(obj, expDict, evalList, pmt1)
+        # Resetting Index to 1 because we get more useful preview results 
+        # in the expression editor
+        obj.Index = 1
+        if obj.ShowElement:
+            for i in range(obj.Count):
+                el = obj.ElementList[i]
+                el.NoTouch = True
+                el.Placement = placementList[i]
+                el.ScaleVector = scaleList[i]
+                el.setPropertyStatus('Placement',   'ReadOnly')
+                el.setPropertyStatus('ScaleVector', 'ReadOnly')
+                el.setPropertyStatus('Scale',       'ReadOnly')
+                el.NoTouch = False
+        else:
+            obj.PlacementList = placementList
+            obj.ScaleList = scaleList
+        return
+
+    # the values of the expressions for all the elements, or None
+    def compiledValues(self, obj, expDict, evalList):
+        if any(pn.lstrip('.') not in _compiledPaths for pn in evalList):
+            return None
+        expressions = [ (pn, expDict[pn]) for pn in evalList ]
+        # compiled again only when the expressions change
+        if getattr(self, 'evaluatorKey', None) != expressions:
+            self.evaluatorKey = expressions
+            try:
+                self.evaluator = Asm4_expr.indexEvaluator(expressions, lambda name: _isNumber(obj, name))
+            except Asm4_expr.Unsupported:
+                self.evaluator = None
+        if self.evaluator is None:
+            return None
+        try:
+            values = self.evaluator.evaluate(obj.Count, lambda name: getattr(obj, name))
+        except (ArithmeticError, ValueError, TypeError, AttributeError):
+            return None
+        return { pn.lstrip('.'): v for pn, v in values.items() }
+
+    # the placements from the compiled values, the Placer is not changed
+    def compiledPlacements(self, obj, values, pmt1):
+        count = obj.Count
+        placer = obj.Placer
+        axis = placer.Rotation.RawAxis
+        def column(path, default):
+            return values.get(path, [default] * count)
+        xs     = column('Placer.Base.x',          placer.Base.x)
+        ys     = column('Placer.Base.y',          placer.Base.y)
+        zs     = column('Placer.Base.z',          placer.Base.z)
+        axs    = column('Placer.Rotation.Axis.x', axis.x)
+        ays    = column('Placer.Rotation.Axis.y', axis.y)
+        azs    = column('Placer.Rotation.Axis.z', axis.z)
+        angles = column('Placer.Rotation.Angle',  degrees(placer.Rotation.Angle))
+        scales = column('Scaler',                 obj.Scaler)
+        axisPlacement = obj.AxisPlacement
+        scaleList = [ App.Vector(s, s, s) for s in scales ]
+        # all the products at once, in closed form
+        if Asm4_expr.hasNumpy:
+            result = Asm4_expr.elementPlacements(
+                        ( tuple(axisPlacement.Base), axisPlacement.Rotation.Q ),
+                        ( tuple(pmt1.Base), pmt1.Rotation.Q ),
+                        list(zip(xs, ys, zs)), list(zip(axs, ays, azs)), angles )
+            if result is not None:
+                (positions, quaternions) = result
+                placementList = [ App.Placement(App.Vector(*p), App.Rotation(*q))
+                                  for p, q in zip(positions.tolist(), quaternions.tolist()) ]
+                return placementList, scaleList
+        placementList = []
+        for i in range(count):
+            rotation = App.Rotation(App.Vector(axs[i], ays[i], azs[i]), angles[i])
+            placer = App.Placement(App.Vector(xs[i], ys[i], zs[i]), rotation)
+            placementList.append(axisPlacement * placer * pmt1)
+        return placementList, scaleList
+
+    # each element evaluated by FreeCAD
+    def evaluatedPlacements(self, obj, expDict, evalList, pmt1):
         placementList = []
         scaleList = []
-        expDict = dict(obj.ExpressionEngine)
-        evalList = _evalOrder(expDict)
-        # calculate placement of each element
         for i in range(obj.Count):
             obj.Index = i
             for pn in evalList:
@@ -566,23 +665,22 @@ class ExpressionArray(LinkArray):
             placementList.append(obj.AxisPlacement * obj.Placer * pmt1)
             s = obj.Scaler
             scaleList.append(App.Vector(s, s, s))
-        # Resetting Index to 1 because we get more useful preview results 
-        # in the expression editor
-        obj.Index = 1
-        if obj.ShowElement:
-            for i in range(obj.Count):
-                el = obj.ElementList[i]
-                el.NoTouch = True
-                el.Placement = placementList[i]
-                el.ScaleVector = scaleList[i]
-                el.setPropertyStatus('Placement',   'ReadOnly')
-                el.setPropertyStatus('ScaleVector', 'ReadOnly')
-                el.setPropertyStatus('Scale',       'ReadOnly')
-                el.NoTouch = False
-        else:
-            obj.PlacementList = placementList
-            obj.ScaleList = scaleList
-        return
+        return placementList, scaleList
+
+# the properties that the compiled expressions can set
+_compiledPaths = (
+    'Placer.Base.x', 'Placer.Base.y', 'Placer.Base.z',
+    'Placer.Rotation.Angle',
+    'Placer.Rotation.Axis.x', 'Placer.Rotation.Axis.y', 'Placer.Rotation.Axis.z',
+    'Scaler',
+)
+
+# a property that expressions can use as a number
+def _isNumber(obj, name):
+    if name not in obj.PropertiesList:
+        return False
+    value = getattr(obj, name)
+    return isinstance(getattr(value, 'Value', value), (int, float))
 
 def findAxisPlacement(axisObj, subnameList):
     if subnameList:
@@ -657,6 +755,23 @@ def _expandEdge(edge):
         return ie
     return [edge]
 
+# expressions -> ( evaluation order, error message or None )
+_evalOrders = {}
+
+# the evaluation order is found only for expressions that haven't been seen yet
+def _cachedEvalOrder(exDict):
+    key = tuple(sorted(exDict.items()))
+    if key not in _evalOrders:
+        # don't keep the expressions of all past edits
+        if len(_evalOrders) > 256:
+            _evalOrders.clear()
+        try:
+            _evalOrders[key] = ( _evalOrder(exDict), None )
+        except RuntimeError as err:
+            _evalOrders[key] = ( [], str(err) )
+    (order, error) = _evalOrders[key]
+    return list(order), error
+
 def _evalOrder(exDict):
     unresolved = []
     resolved = []
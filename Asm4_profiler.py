@@ -0,0 +1,245 @@
+#!/usr/bin/env python3
+# coding: utf-8
+#
+# Asm4_profiler.py
+#
+# LGPL
+# Copyright HUBERT Zoltán
+#
+# opt-in profiling of the Assembly4 commands and objects
+# every call of a command's Activated() or an Asm4 object's execute()
+# is recorded in a ring buffer, with its duration, the number of objects
+# recomputed during the call and the number of objects in the document
+#
+# enable it with the boolean parameter 'Profiler' in
+# User parameter:BaseApp/Preferences/Mod/Assembly4
+# or from the Python console :
+#
+#   import Asm4_profiler
+#   Asm4_profiler.enable()
+
+
+
+import time, json, csv, functools
+from collections import deque
+
+import FreeCAD as App
+from FreeCAD import Console as FCC
+
+
+
+"""
+    +-----------------------------------------------+
+    |                 some definitions              |
+    +-----------------------------------------------+
+"""
+paramPath = 'User parameter:BaseApp/Preferences/Mod/Assembly4'
+
+# the fields of a record, in the order of the CSV export
+recordFields = [ 'time', 'name', 'object', 'depth', 'duration', 'recomputes',
+                 'created', 'deleted', 'objects', 'error' ]
+
+defaultBufferSize = 1000
+
+# the recorded calls
+records = deque( maxlen=App.ParamGet(paramPath).GetInt('ProfilerBufferSize', defaultBufferSize) or defaultBufferSize )
+
+# whether calls are recorded
+enabled = False
+
+# the nesting level of the calls being recorded
+depth = 0
+
+
+
+"""
+    +-----------------------------------------------+
+    |     count the recomputed/created objects      |
+    +-----------------------------------------------+
+"""
+class profilerObserver():
+
+    def __init__(self):
+        self.recomputes = 0
+        self.created    = 0
+        self.deleted    = 0
+
+    def slotRecomputedObject(self, obj):
+        self.recomputes += 1
+
+    def slotCreatedObject(self, obj):
+        self.created += 1
+
+    def slotDeletedObject(self, obj):
+        self.deleted += 1
+
+    def counters(self):
+        return ( self.recomputes, self.created, self.deleted )
+
+
+observer = profilerObserver()
+
+
+def enable( save=False ):
+    global enabled
+    if not enabled:
+        App.addDocumentObserver(observer)
+        enabled = True
+    if save:
+        App.ParamGet(paramPath).SetBool('Profiler', True)
+
+
+def disable( save=False ):
+    global enabled
+    if enabled:
+        App.removeDocumentObserver(observer)
+        enabled = False
+    if save:
+        App.ParamGet(paramPath).SetBool('Profiler', False)
+
+
+def clear():
+    records.clear()
+
+
+
+"""
+    +-----------------------------------------------+
+    |                record a call                  |
+    +-----------------------------------------------+
+"""
+def objectCount():
+    doc = App.ActiveDocument
+    return len(doc.Objects) if doc else 0
+
+
+# wraps a function so that its calls are recorded when the profiler is enabled
+# objArg is the position of the argument that is the document object, if any
+def profiled( name, function, objArg=None ):
+    @functools.wraps(function)
+    def wrapper(*args, **kwargs):
+        global depth
+        if not enabled:
+            return function(*args, **kwargs)
+        record = { 'time': time.time(), 'name': name, 'object': '', 'error': '', 'depth': depth }
+        if objArg is not None and len(args) > objArg:
+            record['object'] = getattr(args[objArg], 'FullName', '')
+        before = observer.counters()
+        depth += 1
+        start = time.perf_counter()
+        try:
+            return function(*args, **kwargs)
+        except Exception as err:
+            record['error'] = type(err).__name__+': '+str(err)
+            raise
+        finally:
+            record['duration'] = time.perf_counter() - start
+            depth -= 1
+            after = observer.counters()
+            record['recomputes'] = after[0] - before[0]
+            record['created']    = after[1] - before[1]
+            record['deleted']    = after[2] - before[2]
+            record['objects']    = objectCount()
+            records.append(record)
+    wrapper.profiled = True
+    return wrapper
+
+
+# wrap the Activated() of a command instance
+def profileCommand( name, command ):
+    activated = getattr(command, 'Activated', None)
+    if activated is not None and not getattr(activated, 'profiled', False):
+        command.Activated = profiled( name, activated )
+    return command
+
+
+# wrap the execute() of the proxies in Asm4_objects
+def profileObjects():
+    import Asm4_objects
+    for cls in [ Asm4_objects.VariantLink, Asm4_objects.LinkArray, Asm4_objects.ExpressionArray ]:
+        execute = cls.__dict__.get('execute')
+        if execute is not None and not getattr(execute, 'profiled', False):
+            # self is args[0], the document object args[1]
+            setattr( cls, 'execute', profiled( 'Asm4_objects.'+cls.__name__+'.execute', execute, objArg=1 ) )
+
+
+
+"""
+    +-----------------------------------------------+
+    |    hook Gui.addCommand during initialisation  |
+    +-----------------------------------------------+
+"""
+addCommand = None
+
+# whether the commands added now are profiled
+hooked = False
+
+# Gui.addCommand while hooked, other hooks may be installed on top of it
+# so it stays in the chain after unhookCommands() and then only passes through
+def profiledAddCommand( name, command, *args ):
+    if hooked:
+        command = profileCommand(name, command)
+    return addCommand( name, command, *args )
+
+
+# called before importing the commands
+def hookCommands():
+    global addCommand, hooked
+    import FreeCADGui as Gui
+    if addCommand is None:
+        addCommand = Gui.addCommand
+        Gui.addCommand = profiledAddCommand
+    hooked = True
+    if App.ParamGet(paramPath).GetBool('Profiler', False):
+        enable()
+
+
+# called after the commands have been imported
+# only our own wrapper is removed, never a hook installed after it
+def unhookCommands():
+    global addCommand, hooked
+    import FreeCADGui as Gui
+    hooked = False
+    if addCommand is not None and Gui.addCommand is profiledAddCommand:
+        Gui.addCommand = addCommand
+        addCommand = None
+
+
+
+"""
+    +-----------------------------------------------+
+    |               summary and export              |
+    +-----------------------------------------------+
+"""
+# the statistics per command/object type
+def summary():
+    stats = {}
+    for record in records:
+        stat = stats.setdefault( record['name'], { 'name': record['name'], 'calls': 0, 'total': 0.0,
+                                 'max': 0.0, 'recomputes': 0, 'errors': 0, 'slowest': '' } )
+        stat['calls'] += 1
+        stat['total'] += record['duration']
+        stat['recomputes'] += record['recomputes']
+        if record['error']:
+            stat['errors'] += 1
+        if record['duration'] >= stat['max']:
+            stat['max'] = record['duration']
+            stat['slowest'] = record['object']
+    for stat in stats.values():
+        stat['mean'] = stat['total'] / stat['calls']
+    return sorted( stats.values(), key=lambda s: s['total'], reverse=True )
+
+
+def exportJSON( fileName ):
+    with open(fileName, 'w') as outFile:
+        json.dump( { 'records': list(records), 'summary': summary() }, outFile, indent=2 )
+    FCC.PrintMessage('Asm4 profiler: '+str(len(records))+' records written to '+fileName+'\n')
+
+
+def exportCSV( fileName ):
+    with open(fileName, 'w', newline='') as outFile:
+        writer = csv.DictWriter( outFile, fieldnames=recordFields, extrasaction='ignore' )
+        writer.writeheader()
+        for record in records:
+            writer.writerow(record)
+    FCC.PrintMessage('Asm4 profiler: '+str(len(records))+' records written to '+fileName+'\n')
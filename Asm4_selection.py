@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+# coding: utf-8
+#
+# Asm4_selection.py
+#
+# LGPL
+# Copyright HUBERT Zoltán
+#
+# analysis of the selection shared by the commands' IsActive()
+# FreeCAD polls IsActive() on every GUI refresh, but the selection only
+# changes when the user clicks: the analysis is done once per selection
+# change and the result is kept until the next one, or until an object is
+# changed or deleted since the results may hold it
+#
+# usage in a command:
+#
+#   def IsActive(self):
+#       self.selection = Asm4_selection.cached( 'myAnalysis', self.analyseSelection )
+#       return self.selection is not None
+
+
+
+import FreeCADGui as Gui
+import FreeCAD as App
+
+
+
+"""
+    +-----------------------------------------------+
+    |     follow the changes of the selection       |
+    +-----------------------------------------------+
+"""
+class selectionState():
+
+    def __init__(self):
+        # incremented at each selection change
+        self.generation = 0
+        # analysis name -> result, for the current generation
+        self.results    = {}
+        # the document the results are about
+        self.document   = None
+
+    def changed(self):
+        self.generation += 1
+        self.results.clear()
+
+    def addSelection(self, doc, obj, sub, pnt):
+        self.changed()
+
+    def removeSelection(self, doc, obj, sub):
+        self.changed()
+
+    def setSelection(self, doc):
+        self.changed()
+
+    def clearSelection(self, doc):
+        self.changed()
+
+    # the objects of the document, the results may be about them
+    def slotCreatedObject(self, obj):
+        self.results.clear()
+
+    def slotDeletedObject(self, obj):
+        self.changed()
+
+    def slotChangedObject(self, obj, prop):
+        self.results.clear()
+
+    def slotDeletedDocument(self, doc):
+        if doc is self.document:
+            self.document = None
+        self.changed()
+
+
+state = selectionState()
+Gui.Selection.addObserver(state)
+App.addDocumentObserver(state)
+
+
+
+"""
+    +-----------------------------------------------+
+    |                cached analyses                |
+    +-----------------------------------------------+
+"""
+# returns analysis() as computed for the current selection,
+# it is only called again after the selection, the active document or its objects have changed
+def cached( name, analysis ):
+    doc = App.ActiveDocument
+    if doc is not state.document:
+        state.changed()
+        state.document = doc
+    if name not in state.results:
+        state.results[name] = analysis()
+    return state.results[name]
+
+
+# forget the results, for commands that change the selected objects themselves
+def invalidate():
+    state.changed()
@@ -0,0 +1,195 @@
+#!/usr/bin/env python3
+# coding: utf-8
+#
+# Asm4_sheet.py
+#
+# LGPL
+# Copyright HUBERT Zoltán
+#
+# bulk writing of tables into spreadsheets
+# this file must not import any GUI module
+#
+# the cells are collected in memory, and written in one go by commit():
+# a sheet that is rebuilt from scratch is loaded with a single importFile()
+# and its aliases are set afterwards, otherwise only the cells that have
+# changed are set. A table that is mostly rewritten can load() the sheet
+# first and be rebuilt from scratch
+#
+# usage:
+#
+#   table = Asm4_sheet.tableWriter(sheet)
+#   table.setRow( 1, ['Name', 'Qty.'] )
+#   table.set( 'A2', 'Screw' )
+#   table.commit( clear=True )
+
+
+
+import os, csv, tempfile
+
+import FreeCAD as App
+from FreeCAD import Console as FCC
+
+
+
+"""
+    +-----------------------------------------------+
+    |               cell addresses                  |
+    +-----------------------------------------------+
+"""
+# 0 -> A, 25 -> Z, 26 -> AA ...
+def columnName( index ):
+    name = ''
+    index += 1
+    while index > 0:
+        (index, rem) = divmod(index-1, 26)
+        name = chr(ord('A') + rem) + name
+    return name
+
+
+# A -> 0, Z -> 25, AA -> 26 ...
+def columnIndex( name ):
+    index = 0
+    for char in name.upper():
+        index = index * 26 + ord(char) - ord('A') + 1
+    return index - 1
+
+
+# the column is 0-based, the row 1-based like in the spreadsheet
+def cellName( col, row ):
+    return columnName(col) + str(row)
+
+
+# 'AB12' -> ( 27, 12 )
+def splitCell( cell ):
+    letters = ''.join( c for c in cell if c.isalpha() )
+    return ( columnIndex(letters), int(cell[len(letters):]) )
+
+
+
+"""
+    +-----------------------------------------------+
+    |                the table writer               |
+    +-----------------------------------------------+
+"""
+class tableWriter():
+
+    def __init__(self, sheet):
+        self.sheet = sheet
+        # cell -> content, in the order they were set
+        self.cells   = {}
+        # cell -> alias
+        self.aliases = {}
+        # column -> where to look for the next free row
+        self.freeRows = {}
+        # column -> width
+        self.widths   = {}
+
+    def set(self, cell, value):
+        self.cells[cell.upper()] = str(value)
+
+    # values in consecutive cells of a row, starting at column col
+    def setRow(self, row, values, col=0):
+        for i, value in enumerate(values):
+            self.cells[cellName(col+i, row)] = str(value)
+
+    def setAlias(self, cell, alias):
+        self.aliases[cell.upper()] = alias
+
+    def setColumnWidth(self, col, width):
+        self.widths[col.upper()] = width
+
+    # read the whole sheet, to rebuild it with commit(clear=True): its contents, column
+    # widths and the aliases of aliasColumns. Returns False if the sheet can't list its cells
+    def load(self, aliasColumns=()):
+        if not hasattr(self.sheet, 'getUsedCells'):
+            return False
+        cells = {}
+        for cell in self.sheet.getUsedCells():
+            content = self.sheet.getContents(cell)
+            if content != '':
+                cells[cell] = content
+            col = ''.join( c for c in cell if c.isalpha() )
+            if col not in self.widths:
+                self.widths[col] = self.sheet.getColumnWidth(col)
+            if col in aliasColumns and cell not in self.aliases:
+                alias = self.sheet.getAlias(cell)
+                if alias:
+                    self.aliases[cell] = alias
+        # what has been set already stays
+        cells.update(self.cells)
+        self.cells = cells
+        return True
+
+    # the content of a cell, including what is not committed yet
+    def get(self, cell):
+        cell = cell.upper()
+        if cell in self.cells:
+            return self.cells[cell]
+        return self.sheet.getContents(cell)
+
+    # the first empty row of a column at or after start, to append a row to a table
+    def freeRow(self, col='A', start=1):
+        row = max(start, self.freeRows.get(col, start))
+        while self.get(col + str(row)) != '':
+            row += 1
+        self.freeRows[col] = row
+        return row
+
+    # write everything to the sheet, clear=True replaces its whole content
+    def commit(self, clear=False):
+        if clear:
+            # the import works line by line and unescapes '\\'
+            plain = not any( '\n' in content or '\\' in content for content in self.cells.values() )
+            if not ( plain and self.importCells() ):
+                self.sheet.clearAll()
+                for cell, content in self.cells.items():
+                    self.sheet.set(cell, content)
+            # the sheet is empty but for the cells, the aliases are set in one pass
+            for cell, alias in self.aliases.items():
+                self.sheet.setAlias(cell, alias)
+        else:
+            for cell, content in self.cells.items():
+                if self.sheet.getContents(cell) != content:
+                    self.sheet.set(cell, content)
+            for cell, alias in self.aliases.items():
+                if self.sheet.getAlias(cell) != alias:
+                    self.sheet.setAlias(cell, alias)
+        # clearing the sheet resets the widths too
+        for col, width in self.widths.items():
+            if clear or self.sheet.getColumnWidth(col) != width:
+                self.sheet.setColumnWidth(col, width)
+        self.reset()
+
+    def reset(self):
+        self.cells    = {}
+        self.aliases  = {}
+        self.freeRows = {}
+        self.widths   = {}
+
+    # load all the cells at once through a temporary tab-separated file
+    def importCells(self):
+        grid = {}
+        lastCol = 0
+        for cell, content in self.cells.items():
+            (col, row) = splitCell(cell)
+            grid.setdefault(row, {})[col] = content
+            lastCol = max(lastCol, col)
+        if not grid:
+            self.sheet.clearAll()
+            return True
+        (fd, fileName) = tempfile.mkstemp(suffix='.csv')
+        try:
+            with os.fdopen(fd, 'w', newline='') as csvFile:
+                writer = csv.writer(csvFile, delimiter='\t', quotechar='"', escapechar='\\',
+                                    doublequote=False, lineterminator='\n')
+                # importFile() starts at A1
+                for row in range(1, max(grid)+1):
+                    cols = grid.get(row, {})
+                    writer.writerow( [ cols.get(col, '') for col in range(lastCol+1) ] )
+            self.sheet.importFile(fileName, '\t', '"', '\\')
+            return True
+        except Exception as err:
+            FCC.PrintWarning('Spreadsheet import failed, writing cell by cell: '+str(err)+'\n')
+            return False
+        finally:
+            os.remove(fileName)
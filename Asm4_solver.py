@@ -0,0 +1,682 @@
+#!/usr/bin/env python3
+# coding: utf-8
+#
+# Asm4_solver.py
+#
+# LGPL
+# Copyright HUBERT Zoltán
+#
+# incremental update of Assembly4 assemblies
+# this file must not import any GUI module, it is also used by FreeCADCmd
+
+
+
+import re
+
+import FreeCAD as App
+from FreeCAD import Console as FCC
+
+# numpy is optional, it's only used to solve many links at once
+try:
+    import numpy
+    hasNumpy = True
+except ImportError:
+    hasNumpy = False
+
+
+
+"""
+    +-----------------------------------------------+
+    |                 some definitions              |
+    +-----------------------------------------------+
+"""
+# solvers that use the Asm4 ExpressionEngine
+asm4Solvers = [ 'Asm4EE', 'Placement::ExpressionEngine' ]
+
+# same as in Asm4_libs
+datumTypes = [ 'PartDesign::CoordinateSystem', 'PartDesign::Plane',
+               'PartDesign::Line', 'PartDesign::Point' ]
+
+# where the Asm4 preferences are stored
+paramPath = 'User parameter:BaseApp/Preferences/Mod/Assembly4'
+
+# changing these properties doesn't move anything
+ignoredProps = [ 'Visibility', 'Label', 'Label2', 'Shape', 'Proxy',
+                 'ViewObject', 'Document', 'State' ]
+
+
+# the assembly container in the document, this is also Asm4.getAssembly()
+# the result is cached per document until its tree changes
+def findAssembly( doc ):
+    if doc is None:
+        return None
+    if doc.Name in observer.assemblies:
+        return observer.assemblies[doc.Name]
+    retval = None
+    for name in ('Assembly','Model'):
+        assy = doc.getObject(name)
+        if assy and assy.TypeId=='App::Part' and assy.getParentGeoFeatureGroup() is None:
+            if hasattr(assy,'Type') and assy.Type=='Assembly':
+                retval = assy
+                break
+            # very old Asm4 Model
+            elif name=='Model':
+                FCC.PrintMessage("Deprecated Asm4 Model detected, this could lead to uncompatibilities\n")
+                retval = assy
+    observer.assemblies[doc.Name] = retval
+    return retval
+
+
+# True if the object is placed by the Asm4 ExpressionEngine to something
+def isAttached( obj ):
+    if hasattr(obj,'SolverId') and hasattr(obj,'AttachedTo'):
+        if obj.SolverId in asm4Solvers and obj.AttachedTo != '':
+            return True
+    return False
+
+
+# splits the AttachedTo property into ( parent link, LCS )
+def splitAttachedTo( obj ):
+    (a_Link, sep, a_LCS) = obj.AttachedTo.partition('#')
+    return (a_Link, a_LCS)
+
+
+
+"""
+    +-----------------------------------------------+
+    |            the attachment graph               |
+    +-----------------------------------------------+
+
+    nodes are the objects of the assembly that are placed by Asm4,
+    an edge goes from the object something is attached to (the parent
+    App::Link, or an attached LCS in the assembly) to the attached object
+"""
+class AttachmentGraph():
+
+    def __init__(self, assembly):
+        self.assembly   = assembly
+        self.doc        = assembly.Document
+        # node name -> names of the nodes it is attached to
+        self.parents    = {}
+        # node name -> names of the nodes attached to it
+        self.dependents = {}
+        # node name -> ( parent link, LCS ) as in AttachedTo
+        self.attachedTo = {}
+        # object name -> path in the assembly, like 'Assembly.Group.Link'
+        self.paths      = {}
+        # names of the App::Links to a Part or a Body in the assembly
+        self.links      = []
+        # set when the structure changed and the graph must be rebuilt
+        self.stale      = False
+        self.build()
+
+    # parse all objects in the assembly, including those in groups
+    def assemblyObjects(self):
+        objects = []
+        stack = [ (obj, self.assembly.Name) for obj in self.assembly.Group ]
+        while stack:
+            (obj, path) = stack.pop()
+            objects.append(obj)
+            self.paths[obj.Name] = path + '.' + obj.Name
+            if obj.TypeId == 'App::DocumentObjectGroup':
+                stack.extend([ (child, path + '.' + obj.Name) for child in obj.Group ])
+        return objects
+
+    def build(self):
+        self.parents.clear()
+        self.dependents.clear()
+        self.attachedTo.clear()
+        self.paths.clear()
+        self.links = []
+        for obj in self.assemblyObjects():
+            if isAttached(obj):
+                self.parents[obj.Name] = []
+                self.dependents.setdefault(obj.Name, set())
+            if obj.isDerivedFrom('App::Link') and hasattr(obj.LinkedObject,'isDerivedFrom'):
+                if obj.LinkedObject.isDerivedFrom('App::Part') or obj.LinkedObject.isDerivedFrom('PartDesign::Body'):
+                    self.links.append(obj.Name)
+        for name in self.parents:
+            self.addEdges(self.doc.getObject(name))
+        self.stale = False
+
+    # the attachment of a single object has changed
+    def update(self, obj):
+        name = obj.Name
+        if name not in self.paths:
+            return
+        # remove the old edges
+        for parent in self.parents.pop(name, []):
+            self.dependents[parent].discard(name)
+        self.attachedTo.pop(name, None)
+        if isAttached(obj):
+            self.parents[name] = []
+            self.dependents.setdefault(name, set())
+            self.addEdges(obj)
+            # objects that were already attached to it before it became a node
+            for other in self.parents:
+                if other != name and self.targetOf(other) == name and name not in self.parents[other]:
+                    self.parents[other].append(name)
+                    self.dependents[name].add(other)
+        else:
+            # nothing depends on a non-node
+            for dep in self.dependents.pop(name, set()):
+                if name in self.parents.get(dep, []):
+                    self.parents[dep].remove(name)
+
+    # the name of the object this node is attached to: a sister link,
+    # or an LCS of the assembly
+    def targetOf(self, name):
+        (a_Link, a_LCS) = self.attachedTo[name]
+        if a_Link == 'Parent Assembly':
+            return a_LCS
+        return a_Link
+
+    def addEdges(self, obj):
+        self.attachedTo[obj.Name] = splitAttachedTo(obj)
+        target = self.targetOf(obj.Name)
+        # only nodes can move
+        if target in self.parents and target != obj.Name:
+            self.parents[obj.Name].append(target)
+            self.dependents[target].add(obj.Name)
+
+    # all nodes downstream of the seed objects, including the seeds that are nodes.
+    # Seeds that are not nodes (Variables, bodies ...) propagate through the InList
+    def downstream(self, seeds):
+        result = set()
+        stack = []
+        for name in seeds:
+            obj = self.doc.getObject(name)
+            if obj is None:
+                continue
+            if name in self.parents:
+                stack.append(name)
+            else:
+                for dep in obj.InListRecursive:
+                    if dep.Name in self.parents:
+                        stack.append(dep.Name)
+        while stack:
+            name = stack.pop()
+            if name not in result:
+                result.add(name)
+                stack.extend(self.dependents[name])
+        return result
+
+    # topological order of the given nodes (all nodes if None), parents first.
+    # Returns None if there is a circular attachment
+    def order(self, names=None):
+        if names is None:
+            names = set(self.parents)
+        indegree = {}
+        for name in names:
+            indegree[name] = len([p for p in self.parents[name] if p in names])
+        ready = sorted([n for n in names if indegree[n] == 0])
+        ordered = []
+        while ready:
+            name = ready.pop()
+            ordered.append(name)
+            for dep in self.dependents[name]:
+                if dep in indegree:
+                    indegree[dep] -= 1
+                    if indegree[dep] == 0:
+                        ready.append(dep)
+        if len(ordered) != len(names):
+            return None
+        return ordered
+
+    # the link (or 'Parent Assembly') the object is attached to
+    def parentOf(self, name):
+        return self.attachedTo.get(name, ('',''))[0]
+
+    # the LCS the object is attached to
+    def lcsOf(self, name):
+        return self.attachedTo.get(name, ('',''))[1]
+
+    # the objects directly attached to this one
+    def dependentsOf(self, name):
+        return self.dependents.get(name, set())
+
+    # the App::Link objects of the assembly
+    def getLinks(self):
+        return [ self.doc.getObject(name) for name in self.links ]
+
+    # the path of an object as in obj.Parents[0], without its trailing dot
+    def pathOf(self, obj):
+        path = self.paths.get(obj.Name)
+        if path is None:
+            parentObj, objFullName = obj.Parents[0]
+            path = parentObj.Name + '.' + objFullName[0:-1]
+        return path
+
+
+
+"""
+    +-----------------------------------------------+
+    |       track the changes in the documents      |
+    +-----------------------------------------------+
+"""
+class attachmentObserver():
+
+    def __init__(self):
+        # document name -> set of changed object names
+        self.dirty    = {}
+        # documents that are followed since they were opened or created
+        self.tracked  = set()
+        # document name -> AttachmentGraph
+        self.graphs   = {}
+        # document name -> { container name : (datums, links) }
+        self.contents = {}
+        # document name -> assembly container (or None)
+        self.assemblies = {}
+        # set while we are solving, our own changes don't count
+        self.updating = False
+
+    def slotCreatedDocument(self, doc):
+        self.tracked.add(doc.Name)
+        self.dirty[doc.Name] = set()
+
+    def slotFinishRestoreDocument(self, doc):
+        self.slotCreatedDocument(doc)
+        self.restructured(doc)
+
+    def slotDeletedDocument(self, doc):
+        self.tracked.discard(doc.Name)
+        self.dirty.pop(doc.Name, None)
+        self.graphs.pop(doc.Name, None)
+        self.contents.pop(doc.Name, None)
+        self.assemblies.pop(doc.Name, None)
+
+    # to be safe, switching documents always looks for the assembly again
+    def slotActivateDocument(self, doc):
+        self.assemblies.pop(doc.Name, None)
+
+    def slotCreatedObject(self, obj):
+        self.touch(obj)
+        self.restructured(obj.Document)
+
+    def slotDeletedObject(self, obj):
+        # the dependents of a deleted object must be updated
+        for dep in obj.InList:
+            self.touch(dep)
+        self.restructured(obj.Document)
+
+    def slotChangedObject(self, obj, prop):
+        if prop not in ignoredProps:
+            self.touch(obj)
+        if obj.Document is None:
+            return
+        if prop in ('Group', 'LinkedObject', 'Type'):
+            self.restructured(obj.Document)
+        elif prop in ('AttachedTo', 'SolverId'):
+            graph = self.graphs.get(obj.Document.Name)
+            if graph and not graph.stale:
+                graph.update(obj)
+
+    # the tree has changed, cached structures of this document are invalid
+    def restructured(self, doc):
+        if doc is None:
+            return
+        graph = self.graphs.get(doc.Name)
+        if graph:
+            graph.stale = True
+        self.contents.pop(doc.Name, None)
+        self.assemblies.pop(doc.Name, None)
+
+    def touch(self, obj):
+        if not self.updating and obj.Document:
+            self.dirty.setdefault(obj.Document.Name, set()).add(obj.Name)
+
+    # returns the changed objects since last time, or None if unknown
+    def popDirty(self, doc):
+        if doc.Name not in self.tracked:
+            return None
+        dirty = self.dirty.get(doc.Name, set())
+        self.dirty[doc.Name] = set()
+        return dirty
+
+
+observer = attachmentObserver()
+App.addDocumentObserver(observer)
+
+
+
+"""
+    +-----------------------------------------------+
+    |              the cached structures            |
+    +-----------------------------------------------+
+"""
+# the attachment graph of the assembly in the document, built once
+# and then kept up to date by the observer. None if there is no assembly
+def getGraph( doc=None ):
+    if doc is None:
+        doc = App.ActiveDocument
+    assy = findAssembly(doc)
+    if assy is None:
+        return None
+    graph = observer.graphs.get(doc.Name)
+    if graph is None or graph.assembly != assy:
+        graph = AttachmentGraph(assy)
+        observer.graphs[doc.Name] = graph
+    elif graph.stale:
+        graph.build()
+    return graph
+
+
+# the datums and the App::Links inside a container (App::Part or Body),
+# including those in its groups and sub-containers
+def getContents( container ):
+    docName = container.Document.Name
+    cache = observer.contents.setdefault(docName, {})
+    if container.Name not in cache:
+        datums = []
+        links = []
+        stack = list(container.Group) if hasattr(container,'Group') else []
+        while stack:
+            obj = stack.pop()
+            if obj.TypeId in datumTypes:
+                datums.append(obj)
+            elif obj.isDerivedFrom('App::Link'):
+                links.append(obj)
+            elif obj.TypeId in ('App::Part','PartDesign::Body','App::DocumentObjectGroup'):
+                stack.extend(obj.Group)
+        cache[container.Name] = (datums, links)
+    return cache[container.Name]
+
+
+
+"""
+    +-----------------------------------------------+
+    |          the native placement solver          |
+    +-----------------------------------------------+
+
+    The Asm4 expressions built by Asm4.makeExpressionPart() and
+    Asm4.makeExpressionDatum() are products of Placements, like:
+    Link.Placement * Doc#LCS.Placement * AttachmentOffset * Doc#LCS.Placement ^ -1
+    They are parsed once into a chain of factors, which are then
+    multiplied directly, with the Placements of the LCS cached during
+    a solve. The expression string stays in the ExpressionEngine for
+    persistence, and anything not understood is left to FreeCAD.
+    With many links, and if numpy is installed, the products are
+    computed in batches of 4x4 matrices.
+"""
+# below this number of similar links, the batched solve isn't worth it
+batchMinSize = 16
+
+# a factor of the expression: [Doc#]Object.Placement [^ -1], or AttachmentOffset
+factorPattern = re.compile(r'^(?:(\w+)#)?(<<.+>>|\w+)\.Placement(\s*\^\s*-1)?$')
+
+
+# True if the user has chosen the native solver in the preferences
+def nativeSolverEnabled():
+    return App.ParamGet(paramPath).GetBool('NativeSolver', False)
+
+
+# returns the list of factors of the Asm4 placement expression, as tuples
+# ( document name or None, object name or None for AttachmentOffset, inverse )
+# or None if the expression isn't a plain product of Placements
+def parseChain( expr ):
+    if not expr:
+        return None
+    chain = []
+    for term in expr.split('*'):
+        term = term.strip()
+        if term == 'AttachmentOffset':
+            chain.append( (None, None, False) )
+            continue
+        match = factorPattern.match(term)
+        if match is None:
+            return None
+        (docName, objName, inverse) = match.groups()
+        chain.append( (docName, objName, inverse is not None) )
+    return chain
+
+
+class nativeSolver():
+
+    def __init__(self):
+        # object name -> ( expression, chain )
+        self.chains = {}
+        # ( document, object, inverse ) -> Placement, only during a solve
+        self.cache  = {}
+        # the same keys -> 4x4 array of the Placement, for the batches
+        self.arrays = {}
+        # the objects solved in this pass, their Placement is read live
+        self.moving = set()
+
+    # the parsed chain of the object, re-parsed only if the expression changed
+    def getChain(self, obj):
+        expr = None
+        for (prop, ex) in obj.ExpressionEngine:
+            if prop == 'Placement':
+                expr = ex
+        known = self.chains.get(obj.FullName)
+        if known is None or known[0] != expr:
+            known = ( expr, parseChain(expr) )
+            self.chains[obj.FullName] = known
+        return known[1]
+
+    # the Placement of one factor
+    def factor(self, obj, docName, objName, inverse):
+        if objName is None:
+            return obj.AttachmentOffset
+        doc = App.getDocument(docName) if docName else obj.Document
+        key = ( doc.Name, objName, inverse )
+        if key in self.cache:
+            return self.cache[key]
+        if objName.startswith('<<'):
+            found = doc.getObjectsByLabel(objName[2:-2])
+            target = found[0] if found else None
+        else:
+            target = doc.getObject(objName)
+        if target is None:
+            raise KeyError(objName)
+        placement = target.Placement.inverse() if inverse else target.Placement
+        # the Placements of the objects moved in this pass must not be cached
+        if not ( doc == obj.Document and target.Name in self.moving ):
+            self.cache[key] = placement
+        return placement
+
+    # computes and applies the Placement of the object, returns False
+    # if it must be left to FreeCAD's ExpressionEngine
+    def solve(self, obj):
+        chain = self.getChain(obj)
+        if chain is None:
+            return False
+        try:
+            placement = App.Placement()
+            for (docName, objName, inverse) in chain:
+                placement = placement * self.factor(obj, docName, objName, inverse)
+        except Exception:
+            return False
+        if not placement.isSame(obj.Placement, 1e-12):
+            obj.Placement = placement
+        return True
+
+    # solves the objects in the given (topological) order
+    def solveAll(self, doc, ordered, graph=None):
+        self.cache  = {}
+        self.arrays = {}
+        self.moving = set(ordered)
+        if hasNumpy and graph is not None and len(ordered) >= batchMinSize:
+            fallback = self.solveBatched(doc, ordered, graph)
+        else:
+            fallback = []
+            for name in ordered:
+                obj = doc.getObject(name)
+                if not self.solve(obj):
+                    self.recompute(obj)
+                    fallback.append(name)
+        self.cache  = {}
+        self.arrays = {}
+        return fallback
+
+    # what we couldn't solve is left to the ExpressionEngine
+    def recompute(self, obj):
+        obj.touch()
+        obj.recompute()
+
+    # the homogeneous 4x4 matrix of a Placement
+    def toArray(self, placement):
+        return numpy.array(placement.toMatrix().A).reshape(4,4)
+
+    # the 4x4 matrix of one factor, converted once for the factors that are cached
+    def factorArray(self, obj, docName, objName, inverse):
+        if objName is None:
+            return self.toArray(obj.AttachmentOffset)
+        doc = App.getDocument(docName) if docName else obj.Document
+        key = ( doc.Name, objName, inverse )
+        if key in self.arrays:
+            return self.arrays[key]
+        array = self.toArray( self.factor(obj, docName, objName, inverse) )
+        if key in self.cache:
+            self.arrays[key] = array
+        return array
+
+    # solves the links level by level: all links of a level only depend on links
+    # of the previous levels. In each level, the chains with the same number of
+    # factors are stacked into (n,4,4) arrays and multiplied at once
+    def solveBatched(self, doc, ordered, graph):
+        fallback = []
+        # the level of each object in the attachment tree
+        levels = {}
+        for name in ordered:
+            parentLevels = [ levels[p] for p in graph.parents[name] if p in levels ]
+            levels[name] = max(parentLevels) + 1 if parentLevels else 0
+        batches = {}
+        for name in ordered:
+            obj = doc.getObject(name)
+            chain = self.getChain(obj)
+            # chain length 0 is for those left to the ExpressionEngine
+            length = len(chain) if chain else 0
+            batches.setdefault( (levels[name], length), [] ).append(obj)
+        # levels are solved in order, so that parents are always placed first
+        for key in sorted(batches):
+            objs = batches[key]
+            # small batches aren't worth the conversions
+            if key[1] == 0 or len(objs) < batchMinSize:
+                for obj in objs:
+                    if not self.solve(obj):
+                        self.recompute(obj)
+                        fallback.append(obj.Name)
+                continue
+            # one (n,4,4) stack per factor position in the chains
+            stacks = [ [] for i in range(key[1]) ]
+            solvable = []
+            for obj in objs:
+                try:
+                    matrices = [ self.factorArray(obj, *f) for f in self.getChain(obj) ]
+                except Exception:
+                    self.recompute(obj)
+                    fallback.append(obj.Name)
+                    continue
+                solvable.append(obj)
+                for i, matrix in enumerate(matrices):
+                    stacks[i].append(matrix)
+            if not solvable:
+                continue
+            result = numpy.array(stacks[0])
+            for stack in stacks[1:]:
+                result = numpy.matmul(result, numpy.array(stack))
+            # write back in one pass
+            for obj, matrix in zip(solvable, result):
+                placement = App.Placement(App.Matrix(*matrix.flatten().tolist()))
+                if not placement.isSame(obj.Placement, 1e-12):
+                    obj.Placement = placement
+        return fallback
+
+
+native = nativeSolver()
+
+
+
+"""
+    +-----------------------------------------------+
+    |                update functions               |
+    +-----------------------------------------------+
+"""
+# the historic update: recompute every App::Part
+def fullUpdate( doc ):
+    for obj in doc.Objects:
+        if obj.TypeId == 'App::Part':
+            obj.recompute(True)
+    observer.tracked.add(doc.Name)
+    observer.dirty[doc.Name] = set()
+
+
+# recompute only the objects downstream of what has changed, in attachment order
+# returns the number of recomputed objects, or None if a full update was done
+def updateAssembly( doc=None, dirty=None ):
+    if doc is None:
+        doc = App.ActiveDocument
+    if doc is None:
+        return None
+    assy = findAssembly(doc)
+    if dirty is None:
+        dirty = observer.popDirty(doc)
+    # we don't know what has changed (or there's no assembly): do the full update
+    if assy is None or dirty is None:
+        fullUpdate(doc)
+        return None
+    # the changes in linked documents are in their own dirty sets
+    linked = linkedDocuments(doc)
+    if any( observer.dirty.get(d.Name) or d.Name not in observer.tracked or d.isTouched()
+            for d in linked ):
+        fullUpdate(doc)
+        # the recursive recompute has taken care of them
+        for d in linked:
+            observer.tracked.add(d.Name)
+            observer.dirty[d.Name] = set()
+        return None
+    # things FreeCAD knows have changed
+    for obj in doc.Objects:
+        if obj.isTouched():
+            dirty.add(obj.Name)
+    graph = getGraph(doc)
+    ordered = graph.order(graph.downstream(dirty))
+    if ordered is None:
+        FCC.PrintWarning('Circular attachment detected in '+doc.Name+', doing a full update\n')
+        fullUpdate(doc)
+        return None
+    observer.updating = True
+    try:
+        # first the non-attached touched objects, FreeCAD sorts them out
+        others = [doc.getObject(n) for n in dirty if n not in graph.parents and doc.getObject(n)]
+        others = [o for o in others if o.isTouched()]
+        if others:
+            doc.recompute(others)
+        # then the attached objects, parents first
+        if nativeSolverEnabled():
+            native.solveAll(doc, ordered, graph)
+        else:
+            for name in ordered:
+                obj = doc.getObject(name)
+                obj.touch()
+                obj.recompute()
+        # then what uses the moved objects without being attached to them:
+        # expression arrays, features using the shape or placement of a link ...
+        users = dependentObjects(doc, ordered, graph)
+        if users:
+            for obj in users:
+                obj.touch()
+            doc.recompute(users)
+        assy.recompute()
+    finally:
+        observer.updating = False
+    return len(ordered) + len(users)
+
+
+# the other documents this one links to, directly or not
+def linkedDocuments( doc ):
+    return [ d for d in doc.getDependentDocuments() if d != doc ]
+
+
+# the objects of the document that depend on the nodes but aren't nodes themselves
+def dependentObjects( doc, names, graph ):
+    users = {}
+    for name in names:
+        obj = doc.getObject(name)
+        if obj is None:
+            continue
+        for dep in obj.InListRecursive:
+            if dep.Document == doc and dep.Name not in graph.parents and dep != graph.assembly:
+                users[dep.Name] = dep
+    return list(users.values())
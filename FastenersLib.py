@@ -17,6 +17,7 @@ from ScrewMaker import screwTables
 import FastenersCmd as FS
 
 import Asm4_libs as Asm4
+import Asm4_selection
 
 
 
@@ -294,7 +295,8 @@ class cloneFastenersToAxesCmd():
                 }
     
     def IsActive(self):
-        self.selection = self.getSelectedAxes()
+        # walking the sub-elements is only done when the selection changes
+        self.selection = Asm4_selection.cached( 'fastenerAxes', self.getSelectedAxes )
         if Asm4.getAssembly() and self.selection:
             return True
         return False
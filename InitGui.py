@@ -113,6 +113,9 @@ class Assembly4Workbench(Workbench):
         
         FreeCAD.Console.PrintMessage(_atr("Asm4", "Initializing Assembly4 workbench")+ ' ('+Asm4_version+') .')
         FreeCADGui.updateGui()
+        # wrap the commands for the profiler, it only records when enabled
+        import Asm4_profiler
+        Asm4_profiler.hookCommands()
         # import all stuff
         import newAssemblyCmd    # created an App::Part container called 'Assembly'
         self.dot()
@@ -136,7 +139,9 @@ class Assembly4Workbench(Workbench):
         self.dot()
         import VariablesLib        # creates an LCS in assembly and attaches it to an LCS relative to an external file
         self.dot()
-        import AnimationLib        # creates an LCS in assembly and attaches it to an LCS relative to an external file
+        # the heavy modules are only loaded when one of their commands is used
+        import Asm4_lazy
+        Asm4_lazy.addLazyModule('AnimationLib')       # animates the assembly
         self.dot()
         import updateAssemblyCmd   # updates all parts and constraints in the assembly
         self.dot()
@@ -146,29 +151,35 @@ class Assembly4Workbench(Workbench):
         self.dot()
         import gotoDocumentCmd     # opens the documentof the selected App::Link
         self.dot()
-        import Asm4_Measure        # Measure tool in the Task panel
+        Asm4_lazy.addLazyModule('Asm4_Measure')       # Measure tool in the Task panel
         self.dot()
-        import makeBomCmd          # creates the parts list
+        Asm4_lazy.addLazyModule('makeBomCmd')         # creates the parts list
         self.dot()
-        import exportFiles         # creates a hierarchical tree listing of files in an assembly
+        Asm4_lazy.addLazyModule('exportFiles')        # creates a hierarchical tree listing of files in an assembly
         self.dot()
         import HelpCmd             # shows a basic help window
         self.dot()
         import showHideLcsCmd      # shows/hides all the LCSs
         self.dot()
-        import configurationEngine # save/restore configuration
+        Asm4_lazy.addLazyModule('configurationEngine')# save/restore configuration
+        self.dot()
+        import profilerCmd         # shows the time spent in the commands
         self.dot()
 
         # Fasteners
         if self.checkWorkbench('FastenersWorkbench'):
             # a library to handle fasteners from the FastenersWorkbench
-            import FastenersLib
+            Asm4_lazy.addLazyModule('FastenersLib')
+            import Asm4_libs as Asm4
+            Gui.addCommand( 'Asm4_Fasteners', Asm4.dropDownCmd( list(Asm4_lazy.lazyModules['FastenersLib']), 'Fasteners'))
             self.FastenersCmd = 'Asm4_Fasteners'
         else:
             # a dummy library if the FastenersWorkbench is not installed
             import FastenersDummy
             self.FastenersCmd = 'Asm4_insertScrew'
         self.dot()
+        Asm4_profiler.unhookCommands()
+        Asm4_profiler.profileObjects()
 
 
         # Define Menus
@@ -183,7 +194,7 @@ class Assembly4Workbench(Workbench):
         # self.appendMenu("&Geometry",["Asm4_newPart"])
 
         # additional entry in the Help menu
-        self.appendMenu(QT_TRANSLATE_NOOP("Workbench", "&Help"), ["Asm4_Help"])
+        self.appendMenu(QT_TRANSLATE_NOOP("Workbench", "&Help"), ["Asm4_Help", "Asm4_profiler"])
         self.dot()
 
         # Define Toolbars
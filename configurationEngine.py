@@ -14,6 +14,10 @@ import FreeCAD as App
 from FreeCAD import Console as FCC
 
 import Asm4_libs as Asm4
+import Asm4_solver
+import Asm4_sheet
+import Asm4_config
+import Asm4_motion
 
 ASM4_CONFIG_TYPE        = 'Asm4::ConfigurationTable'
 HEADER_CELL             = 'A1'
@@ -37,7 +41,9 @@ NAME_COL_WIDTH          = 250
     |     create a new empty configuration table    |
     +-----------------------------------------------+
 """
-def createConfig(name, description):
+# compact=True makes an Asm4_config container instead of a spreadsheet,
+# by default it depends on the CompactConfigurations parameter
+def createConfig(name, description, compact=None):
     group = getConfGroup()
     if not group:
         # create a group Configurations to store various config tables
@@ -47,6 +53,10 @@ def createConfig(name, description):
         else:
             FCC.PrintWarnin('No assembly container here, quitting\n')
             return
+    if compact is None:
+        compact = App.ParamGet(Asm4_solver.paramPath).GetBool('CompactConfigurations', False)
+    if compact:
+        return Asm4_config.makeConfig(group, name, description)
     # Create the document
     conf = group.newObject('Spreadsheet::Sheet', name)
     headerRow = str(int(OBJECTS_START_ROW)-1)
@@ -131,6 +141,8 @@ class openConfigurationsUI():
         iconFile = os.path.join( Asm4.iconPath , 'Asm4_Variables.svg')
         self.form.setWindowIcon(QtGui.QIcon( iconFile ))
         self.form.setWindowTitle('Assembly Configurations')
+        # the motion being played, kept for its timer
+        self.motion = None
 
         # draw the GUI, objects are defined later down
         self.drawUI()
@@ -143,6 +155,8 @@ class openConfigurationsUI():
 
     # OK = apply and close
     def accept(self):
+        if self.motion:
+            self.motion.stop()
         if len(self.configList.selectedItems()) == 1:
             self.Restore()
         Gui.Control.closeDialog()
@@ -196,8 +210,29 @@ class openConfigurationsUI():
             SaveConfiguration( confName, confDescr )
 
 
+    # what differs from the selected configuration
+    def onCompare(self):
+        selectedItems = self.configList.selectedItems()
+        if len(selectedItems) == 1:
+            printDifferences(self.configList.currentItem().name)
+
+    # move from the current state to the selected configuration
+    def onMotion(self):
+        selectedItems = self.configList.selectedItems()
+        if len(selectedItems) != 1:
+            Asm4.warningBox('Please select a configuration in the list')
+            return
+        if self.motion:
+            self.motion.stop()
+        self.motion = motionBetween(None, self.configList.currentItem().name)
+        if self.motion:
+            self.motion.play()
+
+
     # Cancel / Close
     def reject(self):
+        if self.motion:
+            self.motion.stop()
         Gui.Control.closeDialog()
 
     # fill description
@@ -251,8 +286,14 @@ class openConfigurationsUI():
         self.newButton = QtGui.QPushButton('New')
         self.deleteButton = QtGui.QPushButton('Delete')
         self.overwriteButton = QtGui.QPushButton('Overwrite')
+        self.compareButton = QtGui.QPushButton('Compare')
+        self.compareButton.setToolTip('Print what differs between the current state and the selected configuration')
+        self.motionButton = QtGui.QPushButton('Move to')
+        self.motionButton.setToolTip('Move smoothly from the current state to the selected configuration')
         # the button layout
         self.buttonLayout.addWidget(self.newButton)
+        self.buttonLayout.addWidget(self.compareButton)
+        self.buttonLayout.addWidget(self.motionButton)
         self.buttonLayout.addStretch()
         self.buttonLayout.addWidget(self.deleteButton)
         self.buttonLayout.addWidget(self.overwriteButton)
@@ -266,6 +307,8 @@ class openConfigurationsUI():
         self.newButton.clicked.connect(self.onNewConfig)
         self.deleteButton.clicked.connect(self.onDelete)
         self.overwriteButton.clicked.connect(self.onOverwrite)
+        self.compareButton.clicked.connect(self.onCompare)
+        self.motionButton.clicked.connect(self.onMotion)
 
 
 """
@@ -413,42 +456,86 @@ def SaveConfiguration(confName, description):
 
     assy = Asm4.getAssembly()
     link = Asm4.getSelectedLink()
+    # a compact configuration is written at once
+    if Asm4_config.isConfigData(conf):
+        entries = Asm4_config.entries(conf)
+        objects = savedObjects(link) if link else savedSubObjects(assy)
+        for obj in objects:
+            entries[getObjectPath(obj)] = objectEntry(obj)
+        Asm4_config.store(conf, entries)
+        return
+    # the table is rebuilt in memory with the rows that are kept, and written
+    # to the sheet all at once at the end, its aliases in one pass
+    table = Asm4_sheet.tableWriter(conf)
+    index = indexRows(conf)
+    rebuild = table.load( aliasColumns=[OBJECT_NAME_COL] )
     if link:
-        SaveObject(conf, link)
+        SaveObject(table, link, index)
     else:
-        SaveSubObjects(conf, assy)            
+        SaveSubObjects(table, assy, index)
+    table.commit( clear=rebuild )
     conf.recompute(True)
 
 
-def SaveSubObjects(conf, container):
+# conf is a tableWriter, or the spreadsheet itself which is then written at the end
+def SaveSubObjects(conf, container, index=None):
+    if not isinstance(conf, Asm4_sheet.tableWriter):
+        table = Asm4_sheet.tableWriter(conf)
+        SaveSubObjects(table, container, index)
+        table.commit()
+        return
     for objName in container.getSubObjects():
         obj = container.getSubObject(objName, 1)
         # only save properties of certain objects
         if obj.isDerivedFrom('Part::Feature') or obj.isDerivedFrom('App::Link') or obj.isDerivedFrom('App::Part'):
-            SaveObject(conf, obj)
+            SaveObject(conf, obj, index)
         # save subobjects in groups, but not the groups themselves. Skip default Asm4 groups
         elif obj.TypeId == 'App::DocumentObjectGroup' and obj.Name != 'Configurations' and  obj.Name != 'Constraints' and  obj.Name != 'Measures':
-            SaveSubObjects(conf, obj)
+            SaveSubObjects(conf, obj, index)
 
 
-def SaveObject(conf, obj):
+# conf is the Asm4_sheet.tableWriter of the configuration, index its indexRows()
+# a spreadsheet works too, it is written at the end
+def SaveObject(conf, obj, index=None):
+    if not isinstance(conf, Asm4_sheet.tableWriter):
+        table = Asm4_sheet.tableWriter(conf)
+        SaveObject(table, obj, index)
+        table.commit()
+        return
+    if index is None:
+        index = indexRows(conf.sheet)
     # parse App::Part containers, and only those
     if obj.TypeId == 'App::Part':
-        SaveSubObjects(conf, obj)
+        SaveSubObjects(conf, obj, index)
 
-    parentObj, objFullName = obj.Parents[0]
     #objName = App.ActiveDocument.Name + '.' + parentObj.Name + '.' + objFullName
-    objName = parentObj.Name + '.' + objFullName[0:-1]
+    objName = getObjectPath(obj)
 
-    row = GetObjectRow(conf, objName)
+    row = GetObjectRow(conf.sheet, objName, index)
+    # new objects are appended at the end of the table
     if row is None:
-        conf.insertRows(OBJECTS_START_ROW, 1)
-        row = OBJECTS_START_ROW
+        row = str( conf.freeRow(OBJECT_NAME_COL, int(OBJECTS_START_ROW)) )
+        index[GetValidAlias(objName)] = row
 
     conf.set( OBJECT_NAME_COL       + row,  objName )
     conf.setAlias(OBJECT_NAME_COL   + row,  GetValidAlias(objName) )
+    (visible, asmType, placement) = objectEntry(obj)
     # always store visibility info
-    conf.set( OBJECT_VISIBLE_COL    + row,  str(obj.ViewObject.Visibility) )
+    conf.set( OBJECT_VISIBLE_COL    + row,  str(visible) )
+    if asmType != '-':
+        conf.set( OBJECT_ASM_TYPE_COL   + row,  str(asmType) )
+    if placement is not None:
+        (yaw, pitch, roll) = placement.Rotation.toEuler()
+        conf.set( OFFSET_POS_X_COL      + row,  str(placement.Base.x) )
+        conf.set( OFFSET_POS_Y_COL      + row,  str(placement.Base.y) )
+        conf.set( OFFSET_POS_Z_COL      + row,  str(placement.Base.z) )
+        conf.set( OFFSET_ROT_YAW_COL    + row,  str(yaw) )
+        conf.set( OFFSET_ROT_PITCH_COL  + row,  str(pitch) )
+        conf.set( OFFSET_ROT_ROLL_COL   + row,  str(roll) )
+
+
+# ( visibility, assembly type, placement or None ) of an object
+def objectEntry(obj):
     # check how this object is assembled
     asmType = '-'
     if hasattr(obj,'AttacherType'):
@@ -457,31 +544,38 @@ def SaveObject(conf, obj):
         asmType = obj.SolverId
     elif hasattr(obj,'AssemblyType') and obj.AssemblyType!='' :
         asmType = obj.AssemblyType
+    placement = None
     # if the object has a AttacherExtension (MapMode), we leave it alone
     if asmType == 'Attacher':
-        conf.set( OBJECT_ASM_TYPE_COL   + row,  str(asmType) )
+        pass
     # if it's an Assembly4 object
     elif asmType=='Asm4EE' or asmType=='Part::Link' or asmType=='Placement::ExpressionEngine':
         asmType = 'Asm4EE'
-        conf.set( OBJECT_ASM_TYPE_COL   + row,  str(asmType) )
-        offset = obj.AttachmentOffset
-        conf.set( OFFSET_POS_X_COL      + row,  str(offset.Base.x) )
-        conf.set( OFFSET_POS_Y_COL      + row,  str(offset.Base.y) )
-        conf.set( OFFSET_POS_Z_COL      + row,  str(offset.Base.z) )
-        conf.set( OFFSET_ROT_YAW_COL    + row,  str(offset.Rotation.toEuler()[0]) )
-        conf.set( OFFSET_ROT_PITCH_COL  + row,  str(offset.Rotation.toEuler()[1]) )
-        conf.set( OFFSET_ROT_ROLL_COL   + row,  str(offset.Rotation.toEuler()[2]) )
+        placement = obj.AttachmentOffset
     # if it's manually placed
     elif hasattr(obj,'Placement'):
         asmType = 'Manual'
-        conf.set( OBJECT_ASM_TYPE_COL   + row,  str(asmType) )
-        offset = obj.Placement
-        conf.set( OFFSET_POS_X_COL      + row,  str(offset.Base.x) )
-        conf.set( OFFSET_POS_Y_COL      + row,  str(offset.Base.y) )
-        conf.set( OFFSET_POS_Z_COL      + row,  str(offset.Base.z) )
-        conf.set( OFFSET_ROT_YAW_COL    + row,  str(offset.Rotation.toEuler()[0]) )
-        conf.set( OFFSET_ROT_PITCH_COL  + row,  str(offset.Rotation.toEuler()[1]) )
-        conf.set( OFFSET_ROT_ROLL_COL   + row,  str(offset.Rotation.toEuler()[2]) )
+        placement = obj.Placement
+    return ( obj.ViewObject.Visibility, asmType, placement )
+
+
+# the objects saved by SaveObject() and SaveSubObjects(), in the same order
+def savedObjects(obj):
+    if obj.TypeId == 'App::Part':
+        for sub in savedSubObjects(obj):
+            yield sub
+    yield obj
+
+
+def savedSubObjects(container):
+    for objName in container.getSubObjects():
+        obj = container.getSubObject(objName, 1)
+        if obj.isDerivedFrom('Part::Feature') or obj.isDerivedFrom('App::Link') or obj.isDerivedFrom('App::Part'):
+            for sub in savedObjects(obj):
+                yield sub
+        elif obj.TypeId == 'App::DocumentObjectGroup' and obj.Name != 'Configurations' and  obj.Name != 'Constraints' and  obj.Name != 'Measures':
+            for sub in savedSubObjects(obj):
+                yield sub
 
 
 
@@ -499,52 +593,146 @@ def restoreConfiguration(confName):
     assy = Asm4.getAssembly()
     link = Asm4.getSelectedLink()
     if link:
-        restoreObject(conf, link)
+        objects = { getObjectPath(obj): obj for obj in savedObjects(link) }
     else:
-        restoreSubObjects(conf, assy)
-    App.ActiveDocument.recompute()
+        objects = assemblyObjects(assy)
+    # only what differs from the current state is changed, all at once
+    differences = diffWithDocument(conf, objects)
+    changes = []
+    for (path, stored, current) in differences:
+        (visible, asmType, placement) = stored
+        prop = None
+        if placement is not None:
+            if asmType == 'Asm4EE':
+                prop = 'AttachmentOffset'
+            elif asmType == 'Manual':
+                prop = 'Placement'
+        changes.append( (objects[path], visible, prop, placement) )
+    applyChanges(App.ActiveDocument, changes)
+    reportDifferences(conf, differences)
+    return differences
+
+
+# what restoring the configuration would change: [ ( object path, stored entry, current entry ) ]
+# objects is the object path -> object of what is restored
+def diffWithDocument(conf, objects):
+    stored = configEntries(conf)
+    # like the alias of the rows, for objects saved before a rename or regroup
+    aliases = { GetValidAlias(path): path for path in stored }
+    current = {}
+    for path, obj in objects.items():
+        if path not in stored and GetValidAlias(path) in aliases:
+            stored[path] = stored.pop( aliases.pop(GetValidAlias(path)) )
+        if path in stored:
+            current[path] = objectEntry(obj)
+        elif obj.isDerivedFrom('Part::Feature') or obj.isDerivedFrom('App::Link'):
+            FCC.PrintMessage('No data for object "' + path + '" in configuration "' + conf.Name + '"\n')
+    # objects of the configuration that aren't there anymore are ignored
+    return [ (path, entry, other) for (path, entry, other) in Asm4_config.diff(stored, current)
+             if entry is not None and other is not None ]
+
+
+# what changes for an object, as text
+def describeDifference(stored, current):
+    what = []
+    if stored[0] != current[0]:
+        what.append('shown' if stored[0] else 'hidden')
+    if stored[2] is not None and not Asm4_config.samePlacement(stored[2], current[2]):
+        what.append('moved')
+    return ', '.join(what)
+
+
+def reportDifferences(conf, differences):
+    for (path, stored, current) in differences:
+        what = describeDifference(stored, current)
+        if what:
+            FCC.PrintLog('  ' + path + ': ' + what + '\n')
+    FCC.PrintMessage('Configuration "' + conf.Name + '": '+str(len(differences))+' object(s) changed\n')
+
+
+# print what restoring a configuration would change, without changing anything
+def printDifferences(confName):
+    conf = getConfig(confName)
+    assy = Asm4.getAssembly()
+    if assy is None or not isAsm4Config(conf):
+        return []
+    differences = diffWithDocument(conf, assemblyObjects(assy))
+    if not differences:
+        FCC.PrintMessage('The assembly is in configuration "' + confName + '"\n')
+    for (path, stored, current) in differences:
+        FCC.PrintMessage('  ' + path + ': ' + describeDifference(stored, current) + '\n')
+    return differences
 
 # parse container
-def restoreSubObjects(conf, container):
+# without changes, they are applied at once at the end
+def restoreSubObjects(conf, container, index=None, changes=None):
+    if changes is None:
+        changes = []
+        restoreSubObjects(conf, container, index, changes)
+        applyChanges(container.Document, changes)
+        return
     for objName in container.getSubObjects():
         obj = container.getSubObject(objName, 1)
-        restoreObject(conf, obj)
+        restoreObject(conf, obj, index, changes)
 
 
-def restoreObject(conf, obj):
+# adds ( object, visibility, property, placement ) to changes
+def restoreObject(conf, obj, index=None, changes=None):
+    if changes is None:
+        changes = []
+        restoreObject(conf, obj, index, changes)
+        applyChanges(obj.Document, changes)
+        return
+    if index is None:
+        index = indexRows(conf)
     # parse App::Part containers and group subobjects
     if obj.TypeId == 'App::Part' or obj.TypeId == 'App::DocumentObjectGroup':
-        restoreSubObjects(conf, obj)
+        restoreSubObjects(conf, obj, index, changes)
 
-    parentObj, objFullName = obj.Parents[0]
     #objName = App.ActiveDocument.Name + '.' + parentObj.Name + '.' + objFullName
-    objName = parentObj.Name + '.' + objFullName
-    # find the row in the spreadsheet
-    row = GetObjectRow(conf, objName)
-    if row is None:
+    objName = getObjectPath(obj)
+    entry = readEntry(conf, objName, index)
+    if entry is None:
         if obj.isDerivedFrom('Part::Feature') or obj.isDerivedFrom('App::Link'):
             FCC.PrintMessage('No data for object "' + objName + '" in configuration "' + conf.Name + '"\n')
         return
-    # set visibility, valid for all objects
+    (visible, asmType, placement) = entry
+    prop = None
+    if placement is not None:
+        if asmType == 'Asm4EE':
+            prop = 'AttachmentOffset'
+        elif asmType == 'Manual':
+            prop = 'Placement'
+    changes.append( (obj, visible, prop, placement) )
+
+
+# ( visibility, assembly type, placement or None ) of an object in a configuration
+# index is the indexRows() of the configuration
+def readEntry(conf, objName, index):
+    if Asm4_config.isConfigData(conf):
+        return index.get(objName)
+    # find the row in the spreadsheet
+    row = GetObjectRow(conf, objName, index)
+    if row is None:
+        return None
+    return readRow(conf, row, objName)
+
+
+def readRow(conf, row, objName=''):
+    # visibility, valid for all objects
     vis = conf.get( OBJECT_VISIBLE_COL   + row )
-    obj.ViewObject.Visibility = (vis=='True')
-    # try to set the placement
+    asmType = '-'
+    placement = None
+    # the type of objects that aren't placed isn't written
+    if conf.getContents( OBJECT_ASM_TYPE_COL + row ) in ('', '-'):
+        return ( vis=='True', asmType, placement )
+    # try to get the placement
     try:
         asmType = str(conf.get( OBJECT_ASM_TYPE_COL  + row ))
         # if it's an Asm4 object
         if asmType=='Asm4EE' or asmType=='Part::Link' or asmType=='Placement::ExpressionEngine':
-            x         = conf.get( OFFSET_POS_X_COL     + row )
-            y         = conf.get( OFFSET_POS_Y_COL     + row )
-            z         = conf.get( OFFSET_POS_Z_COL     + row )
-            yaw       = conf.get( OFFSET_ROT_YAW_COL   + row )
-            pitch     = conf.get( OFFSET_ROT_PITCH_COL + row )
-            roll      = conf.get( OFFSET_ROT_ROLL_COL  + row )
-            position  = App.Vector(x, y, z)
-            rotation  = App.Rotation(yaw, pitch, roll)
-            offset    = App.Placement(position, rotation)
-            obj.AttachmentOffset = offset
-        # if it's manually placed
-        elif asmType=='Manual':
+            asmType = 'Asm4EE'
+        if asmType=='Asm4EE' or asmType=='Manual':
             x         = conf.get( OFFSET_POS_X_COL     + row )
             y         = conf.get( OFFSET_POS_Y_COL     + row )
             z         = conf.get( OFFSET_POS_Z_COL     + row )
@@ -554,9 +742,69 @@ def restoreObject(conf, obj):
             position  = App.Vector(x, y, z)
             rotation  = App.Rotation(yaw, pitch, roll)
             placement = App.Placement(position, rotation)
-            obj.Placement = placement
     except:
         FCC.PrintMessage('Unknown AssemblyType "'+asmType+'" for object "' + objName + '" in configuration "' + conf.Name + '"\n')
+        placement = None
+    return ( vis=='True', asmType, placement )
+
+
+# set what differs in one transaction, then update only the objects
+# that depend on the moved ones, instead of recomputing the document
+def applyChanges(doc, changes):
+    moved = set()
+    doc.openTransaction('Restore configuration')
+    try:
+        for (obj, visible, prop, placement) in changes:
+            if obj.ViewObject.Visibility != visible:
+                obj.ViewObject.Visibility = visible
+            if prop and not getattr(obj, prop).isSame(placement, 1e-9):
+                setattr(obj, prop, placement)
+                moved.add(obj.Name)
+        # what the observer has seen is already in moved
+        pending = Asm4_solver.observer.popDirty(doc)
+        if pending:
+            moved.update(pending)
+        Asm4_solver.updateAssembly(doc, dirty=moved)
+    finally:
+        doc.commitTransaction()
+    return moved
+
+
+"""
+    +-----------------------------------------------+
+    |      Motion between two configurations        |
+    +-----------------------------------------------+
+"""
+# from the configuration startName, or from the current state if None, to endName
+# the configurations are read once, when the motion is built
+def motionBetween(startName, endName, frames=50, pendulum=False):
+    assy = Asm4.getAssembly()
+    endConf = getConfig(endName)
+    if assy is None or not isAsm4Config(endConf):
+        FCC.PrintWarning('No configuration "' + str(endName) + '" in this assembly\n')
+        return None
+    objects = assemblyObjects(assy)
+    if startName is None:
+        start = liveEntries(objects)
+    else:
+        startConf = getConfig(startName)
+        if not isAsm4Config(startConf):
+            FCC.PrintWarning('No configuration "' + str(startName) + '" in this assembly\n')
+            return None
+        start = configEntries(startConf)
+    end = configEntries(endConf)
+    return Asm4_motion.configurationMotion(assy.Document, start, end, objects, frames, pendulum)
+
+
+# object path -> object, for all the objects that a configuration saves
+def assemblyObjects(assy):
+    return { getObjectPath(obj): obj for obj in savedSubObjects(assy) }
+
+
+# the entries of the current state of these objects
+def liveEntries(objects):
+    return { path: objectEntry(obj) for path, obj in objects.items() }
+
 
 
 """
@@ -565,6 +813,8 @@ def restoreObject(conf, obj):
     +-----------------------------------------------+
 """
 def isAsm4Config(sheet):
+    if Asm4_config.isConfigData(sheet):
+        return True
     if sheet and sheet.TypeId=='Spreadsheet::Sheet':
         if sheet.get(HEADER_CELL)==ASM4_CONFIG_TYPE:
             return True
@@ -594,10 +844,15 @@ def getConfig(name, groupName='Configurations'):
 
 
 def setConfigDescription(conf, description):
-    conf.set(DESCRIPTION_CELL, str(description))
+    if Asm4_config.isConfigData(conf):
+        conf.Description = str(description)
+    else:
+        conf.set(DESCRIPTION_CELL, str(description))
 
 
 def getConfigDescription(conf):
+    if Asm4_config.isConfigData(conf):
+        return conf.Description.strip()
     return str(conf.get(DESCRIPTION_CELL)).strip()
 
 
@@ -614,7 +869,56 @@ def GetValidAlias(str):
     return ret
 
 
-def GetObjectRow(conf, name):
+# the name of the object in the configuration is its path in the assembly,
+# which the attachment index knows without walking the InList of the object
+def getObjectPath(obj):
+    graph = Asm4_solver.getGraph(obj.Document)
+    if graph:
+        return graph.pathOf(obj)
+    parentObj, objFullName = obj.Parents[0]
+    return parentObj.Name + '.' + objFullName[0:-1]
+
+
+# alias -> row of all the objects of a configuration table, read once per save or restore
+# for a compact configuration: object path -> entry
+def indexRows(conf):
+    if Asm4_config.isConfigData(conf):
+        return Asm4_config.entries(conf)
+    index = {}
+    row = int(OBJECTS_START_ROW)
+    while True:
+        name = conf.getContents(OBJECT_NAME_COL + str(row))
+        if name == '':
+            break
+        # strings that look like something else are stored with a leading quote
+        index[GetValidAlias(name.lstrip("'"))] = str(row)
+        row += 1
+    return index
+
+
+# object path -> ( visibility, assembly type, placement ) of any configuration
+def configEntries(conf):
+    if Asm4_config.isConfigData(conf):
+        return Asm4_config.entries(conf)
+    entries = {}
+    row = int(OBJECTS_START_ROW)
+    while True:
+        name = conf.getContents(OBJECT_NAME_COL + str(row)).lstrip("'")
+        if name == '':
+            break
+        entries[name] = readRow(conf, str(row), name)
+        row += 1
+    return entries
+
+
+# what differs between two configurations, whatever their storage
+def diffConfigurations(confA, confB):
+    return Asm4_config.diff( configEntries(confA), configEntries(confB) )
+
+
+def GetObjectRow(conf, name, index=None):
+    if index is not None:
+        return index.get(GetValidAlias(name))
     cell = conf.getCellFromAlias(GetValidAlias(name))
     if cell:
         # leave only numbers in the cell string
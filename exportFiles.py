@@ -29,6 +29,7 @@ import FreeCAD as App
 from FreeCAD import Console as FCC
 
 import Asm4_libs as Asm4
+import Asm4_fcstd
 
 '''
 has_anytree = False
@@ -105,58 +106,10 @@ class listLinkedFiles():
 
 
     # this is where the magic happens. Copied from TreeToAscii macro
-    # Build ASCII tree by recursive call
+    # the ASCII tree is built by Asm4_fcstd, which can also do it without opening the files
     def printChildren(self, objs=None, level=0, baseline=''):
-        for cnt, obj in enumerate(objs,1):
-            # find the filepath
-            filepath = ''
-            if obj.isDerivedFrom('App::Link'):
-                target = obj.LinkedObject
-            else:
-                target = obj
-            # try relative filepath ...
-            if self.root_path:
-                filepath = target.Document.FileName.partition(self.root_path)[2]
-            # ... else absolute
-            if filepath =='':
-                filepath = target.Document.FileName
-            # make the data
-            data = {
-                "LBL"  : obj.Label,
-                "NAME" : '('+obj.Name+')' if obj.Label!=obj.Name else '',
-                "DOC"  : filepath,
-                "TARG" : obj.LinkedObject.Name if obj.isDerivedFrom('App::Link') else ''
-            }
-            # print the line
-            if cnt == len(objs):
-                if level>0:
-                    self.ascii_tree += baseline + self.LAST
-            else:
-                self.ascii_tree += baseline + self.FORK
-            # new data print
-            if obj.isDerivedFrom('App::Link'):
-                pattern = '{LBL} => {TARG} @ {DOC}'
-            else:
-                pattern = '{LBL} {NAME}'
-            self.ascii_tree += pattern.format(**data)
-            # we add the filename for the first element
-            if level==0 and target.Document.FileName != '' :
-                self.ascii_tree += ' @ '+target.Document.FileName
-            self.ascii_tree += '\n'
-            # for the next line
-            if cnt == len(objs):
-                if level>0:
-                    baselinenext = baseline + self.TAB
-                else:
-                    baselinenext = ''
-            else:
-                baselinenext = baseline + self.BRANCH
-            # table of children to be listed next
-            children = []
-            for child in obj.ViewObject.claimChildren():
-                if child.TypeId in self.DEF_TYPES or child.isDerivedFrom('App::Link'):
-                    children.append(child)
-            self.printChildren(children, level + 1, baselinenext)
+        style = ( self.TAB, self.BRANCH, self.FORK, self.LAST )
+        self.ascii_tree += Asm4_fcstd.asciiTree( objs, self.root_path, self.DEF_TYPES, style )
 
 
     def copyToClip(self):
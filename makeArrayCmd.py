@@ -12,6 +12,7 @@ import FreeCAD as App
 from FreeCAD import Console as FCC
 
 import Asm4_libs as Asm4
+import Asm4_selection
 from Asm4_objects import (
     ViewProviderArray,
     ExpressionArray,
@@ -52,7 +53,12 @@ class makeExpressionArray:
         }
 
     def _cacheSelectionInfo(self):
-        """Check axis and caches useful data for selected items.
+        """Caches the selection analysis, it's shared by all array commands
+           and only done again when the selection changes."""
+        self._selectionInfo = Asm4_selection.cached('arraySelection', self._analyseSelection)
+
+    def _analyseSelection(self):
+        """Check axis and returns useful data for selected items.
            Selection must contain one or two objects."""
         sourceObj = None
         objParent = None
@@ -74,8 +80,7 @@ class makeExpressionArray:
                     if findAxisPlacement(axisSel.Object, axisSel.SubElementNames):
                         axisObj = axisSel.Object
                         sub = axisSel.SubElementNames[0:1]
-        # store what we have found
-        self._selectionInfo = sourceObj, objParent, axisObj, sub
+        return sourceObj, objParent, axisObj, sub
 
     def IsActive(self):
         self._cacheSelectionInfo()
@@ -14,6 +14,8 @@ import FreeCADGui as Gui
 import FreeCAD as App
 
 import Asm4_libs as Asm4
+import Asm4_bom
+import Asm4_sheet
 import infoPartCmd
 import infoKeys
 
@@ -87,10 +89,8 @@ class makeBOM:
     def Activated(self):
         self.UI = QtGui.QDialog()
         self.modelDoc = App.ActiveDocument
-        # open user part info template
-        file = open(ConfUserFilejson, 'r')
-        self.infoKeysUser = json.load(file).copy()
-        file.close()
+        # open user part info template, once for the whole BOM
+        self.infoKeysUser = Asm4_bom.loadInfoKeys(ConfUserFilejson)
 
         try:
             self.model = self.modelDoc.Assembly
@@ -117,342 +117,22 @@ class makeBOM:
         self.inSpreadsheet()
         self.BOM.setPlainText(self.Verbose)
 
-    def indent(self, level, tag="|"):
-        spaces = (level + 1) * "  "
-        return "[{level}]{spaces}{tag} ".format(level=str(level), tag=tag, spaces=spaces)
-
-    def listParts(self, obj, level=0, parent=None):
-
-        file = open(ConfUserFilejson, 'r')
-        self.infoKeysUser = json.load(file).copy()
-        file.close()
-
-        max_level = 100
-        if self.follow_subassemblies == False:
-            max_level = 2;
-
-        if obj == None:
-            return
-
-        if self.PartsList == None:
-            self.PartsList = {}
-
-        #=======================
-        # VISIBLE APP LINK
-        #=======================
-
-        if obj.TypeId == 'App::Link':
-            if obj.Visibility == True:
-                print("ASM4> {level}{obj_typeid} | {obj_name} | {obj_label}".format(level=self.indent(level), obj_label=obj.Label, obj_name=obj.FullName, obj_typeid=obj.TypeId))
-
-                # self.Verbose += "> {level} | {type}: {label}, {fullname}".format(level=obj.Label, type="APP_LINK", label=obj.Label, fullname=obj.FullName)
-                # try:
-                #     self.Verbose += "- linked: {linked_obj}\n".format(linked_obj=obj.LinkedObject.Name)
-                # except:
-                #     self.Verbose += "- linked: {linked_obj}\n".format(linked_obj=obj.Name)
-                # self.Verbose += '- not included\n\n'
-
-                # Navigate on objects inside a App:Links (Groups of Fastners)
-                if obj.ElementCount > 0:
-                    for i in range(obj.ElementCount):
-                        self.listParts(obj.LinkedObject, level, parent=obj)
-                else:
-                    self.listParts(obj.LinkedObject, level + 1, parent=obj)
-
-        #==================================
-        # MODEL_PART aka ASM4 SUB-ASSEMBLY
-        #==================================
-        elif obj.TypeId == 'App::Part' and Asm4.isAsm4Model(obj):
-            if level > 0 and level <= max_level and self.follow_subassemblies == False:
-                # Recover the record, if any
-                try:
-                    if self.infoKeysUser.get("Document").get('active'):
-                        try:
-                            doc_name = getattr(obj, self.infoKeysUser.get("Document").get('userData'))
-                        except AttributeError:
-                            doc_name = obj.Document.Name
-                except:
-                    doc_name = obj.Document.Name
-
-                # Recover the record, if any
-                if self.infoKeysUser.get("Part_Label").get('active'):
-                    try:
-                        obj_label = getattr(obj, self.infoKeysUser.get("Part_Label").get('userData'))
-                    except AttributeError:
-                        obj_label = obj.Label
-
-                # The name cannot be Model othewise it will sum all other 'Model' names togueter
-                if obj_label == "Model":
-                   obj_label = obj.Document.Name
-
-                if obj_label in self.PartsList:
-                    if self.PartsList[obj_label]['Document'] == doc_name:
-                        qtd = self.PartsList[obj_label]['Qty.'] + 1
-
-                        print("ASM4> {level}| {qtd}x | {obj_typeid} | {obj_name} | {obj_label}".format(level=self.indent(level, tag=" "), obj_label=obj_label, obj_name=obj.FullName, obj_typeid=obj.TypeId, qtd=qtd))
-
-                        self.Verbose += "> {level} | {type}: {label}, {fullname}\n".format(level=obj_label, type="ASM4_PART", label=obj_label, fullname=obj.FullName)
-                        self.Verbose += "- object already added (" + str(qtd) + ")\n\n"
-                        self.PartsList[obj_label]['Qty.'] = qtd
-
-                else:
-                    print("ASM4> {level}| 1x | {obj_typeid} | {obj_name} | {obj_label}".format(level=self.indent(level, tag=" "), obj_label=obj_label, obj_name=obj.FullName, obj_typeid=obj.TypeId))
-
-                    self.Verbose += "> {level} | {type}: {label}, {fullname}\n".format(level=obj_label, type="ASM4_PART", label=obj_label, fullname=obj.FullName)
-                    self.Verbose += "- adding object (1)\n"
-
-                    self.PartsList[obj_label] = dict()
-                    for prop in self.infoKeysUser:
-
-                        if self.infoKeysUser.get(prop).get('active'):
-                            try: # to get partInfo
-                                getattr(obj, self.infoKeysUser.get(prop).get('userData'))
-                                info = "(predefined)"
-                            except AttributeError:
-                                crea(self,obj)
-                                fill(obj)
-                                info = "(extracted)"
-
-                            if self.infoKeysUser.get(prop).get('visible'):
-                                data = getattr(obj, self.infoKeysUser.get(prop).get('userData'))
-                            else:
-                                data = "-"
-
-                            if data == "":
-                                data = "-"
-
-                            if prop == "Part_Label":
-                                data = obj_label
-
-                            if data != "-":
-                                self.Verbose += "- " + prop + ": " + data + " " + info + "\n"
-
-                            self.PartsList[obj_label][self.infoKeysUser.get(prop).get('userData')] = data
-
-                    self.PartsList[obj_label]['Qty.'] = 1
-                    self.Verbose += '\n'
-
-
-        #============================
-        # STANDALONE MODEL_PART
-        #============================
-
-        elif obj.TypeId == 'App::Part' and not Asm4.isAsm4Model(obj):
-            if level > 0 and level <= max_level:
-                # Recover the record, if any
-                try:
-                    if self.infoKeysUser.get("Document").get('active'):
-                        try:
-                            doc_name = getattr(obj, self.infoKeysUser.get("Document").get('userData'))
-                        except AttributeError:
-                            doc_name = obj.Document.Name
-                except:
-                    doc_name = obj.Document.Name
-
-                # Recover the record, if any
-
-                try:
-                    if self.infoKeysUser.get("Part_Label").get('active'):
-                        try:
-                            obj_label = getattr(obj, self.infoKeysUser.get("Part_Label").get('userData'))
-                        except AttributeError:
-                            obj_label = obj.Label
-                except:
-                    doc_name = obj.Label
-
-                # The name cannot be model othewise it will sum all other 'Model' names togueter
-                if obj_label == "Model":
-                   obj_label = obj.Document.Name
-
-                if obj_label in self.PartsList:
-                    if self.PartsList[obj_label]['Document'] == doc_name:
-                        qtd = self.PartsList[obj_label]['Qty.'] + 1
-                        print("ASM4> {level}| {qtd}x | {obj_typeid} | {obj_name} | {obj_label}".format(level=self.indent(level, tag=" "), obj_label=obj_label, obj_name=obj.FullName, obj_typeid=obj.TypeId, qtd=qtd))
-                        self.Verbose += "> {level} | {type}: {label}, {fullname}\n".format(level=obj_label, type="PART", label=obj_label, fullname=obj.FullName)
-                        self.Verbose += "- object already added (" + str(qtd) + ")\n\n"
-                        self.PartsList[obj_label]['Qty.'] = qtd
-
-                else:
-                    print("ASM4> {level}| 1x | {obj_typeid} | {obj_name} | {obj_label}".format(level=self.indent(level, tag=" "), obj_label=obj_label, obj_name=obj.FullName, obj_typeid=obj.TypeId))
-                    self.Verbose += "> {level} | {type}: {label}, {fullname}\n".format(level=obj_label, type="PART", label=obj_label, fullname=obj.FullName)
-                    self.Verbose += "- adding object (1)\n"
-                    self.PartsList[obj_label] = dict()
-                    for prop in self.infoKeysUser:
-                        if self.infoKeysUser.get(prop).get('active'):
-                            try: # to get partInfo
-                                getattr(obj, self.infoKeysUser.get(prop).get('userData'))
-                                info = "(predefined)"
-                            except AttributeError:
-                                crea(self,obj)
-                                fill(obj)
-                                info = "(extracted)"
-
-                            if self.infoKeysUser.get(prop).get('visible'):
-                                data = getattr(obj, self.infoKeysUser.get(prop).get('userData'))
-                            else:
-                                data = "-"
-
-                            if data == "":
-                                data = "-"
-
-                            if prop == "Part_Label":
-                                data = obj_label
-
-                            if data != "-":
-                                self.Verbose += "- " + prop + ": " + data + " " + info + "\n"
-
-                            self.PartsList[obj_label][self.infoKeysUser.get(prop).get('userData')] = data
-
-                    self.PartsList[obj_label]['Qty.'] = 1
-                    self.Verbose += '\n'
-
-        #============================
-        # STANDALONE MODEL_PARTDESIGN
-        #============================
-
-        elif obj.TypeId == 'PartDesign::Body':
-
-            # if level > 0 and level <= max_level and Asm4.isAsm4Model(parent):
-            if level > 0 and level <= max_level :
-
-                ##### This try/except isn't working right - Document field can't be set, but is active by default.
-                ##### This results in a blank document name and the Quantity never increments on any part.
-                ## Recover the record, if any
-                #try:
-                #    if self.infoKeysUser.get("Document").get('active'):
-                #        try:
-                #            doc_name = getattr(obj, self.infoKeysUser.get("Document").get('userData'))
-                #        except AttributeError:
-                #            doc_name = obj.Document.Name
-                #except:
-                #    doc_name = obj.Document.Name
-                doc_name = obj.Document.Name
-
-                if obj.Label in self.PartsList:
-                    if self.PartsList[obj.Label]['Document'] == doc_name:
-                        qtd = self.PartsList[obj.Label]['Qty.'] + 1
-                        print("ASM4> {level}{qtd}x | {obj_typeid} | {obj_name} | {obj_label}".format(level=self.indent(level, tag=" "), obj_label=obj.Label, obj_name=obj.FullName, obj_typeid=obj.TypeId, qtd=qtd))
-                        self.Verbose += "> {level} | {type}: {label}, {fullname}\n".format(level=obj.Label, type="PART", label=obj.Label, fullname=obj.FullName)
-                        self.Verbose += "- object already added (" + str(qtd) + ")\n\n"
-                        self.PartsList[obj.Label]['Qty.'] = qtd
-
-                else:
-                    print("ASM4> {level}1x | {obj_typeid} | {obj_name} | {obj_label}".format(level=self.indent(level, tag=" "), obj_label=obj.Label, obj_name=obj.FullName, obj_typeid=obj.TypeId))
-                    self.Verbose += "> {level} | {type}: {label}, {fullname}\n".format(level=obj.Label, type="PARTDESIGN", label=obj.Label, fullname=obj.FullName)
-                    self.Verbose += "- adding object (1)\n"
-                    self.PartsList[obj.Label] = dict()
-                    for prop in self.infoKeysUser:
-                        self.Verbose +=  "- " + prop + ': '
-                        if prop == 'Document':
-                            data = obj.Document.Label
-                        elif prop == 'PartName':
-                            data = obj.PartName
-                        elif prop == 'PartLength':
-                            data = obj.PartLength
-                        elif prop == 'PartWidth':
-                            data = obj.PartWidth
-                        elif prop == 'PartHeight':
-                            data = obj.PartHeight
-                        else:
-                            data = "-"
-
-                        if data != "-":
-                            self.Verbose += data + '\n'
-
-                        self.PartsList[obj.Label][self.infoKeysUser.get(prop).get('userData')] = data
-
-                    self.PartsList[obj.Label]['Qty.'] = 1
-                    self.Verbose += '\n'
-
-
-        #============================
-        # FASTENERS AND ARRAYS
-        #============================
-
-        elif obj.TypeId == 'Part::FeaturePython' and (obj.Content.find("FastenersCmd") or (obj.Content.find("PCBStandoff")) > -1):
-            
-            if level > 0 and level <= max_level:
-                doc_name = os.path.splitext(os.path.basename(obj.Document.FileName))[0]
-                obj_label = re.sub(r'[0-9]+$', '', obj.Label)
-
-                # if array
-                if obj.Content.find("Orthogonal array"):
-                  # count up the objects in the array
-                  x_count = obj.NumberX
-                  y_count = obj.NumberY
-                  z_count = obj.NumberZ
-                  total = x_count * y_count * z_count
-                  # identify the linked object
-                  subobj = obj.Base.LinkedObject
-                  # count each instance of linked object
-                  for i in range(0, total):
-                    print("    ", i, "...")
-                    self.listParts(subobj, level, parent=obj)
-
-                elif obj_label in self.PartsList:
-                    if self.PartsList[obj_label]['Document'] == doc_name:
-                        qtd = self.PartsList[obj_label]['Qty.'] + 1
-                        print("ASM4> {level}| {qtd}x | {obj_typeid} | {obj_name} | {obj_label}".format(level=self.indent(level, tag=" "), obj_label=obj_label, obj_name=obj.FullName, obj_typeid=obj.TypeId, qtd=qtd))
-                        self.Verbose += "> {level} | {type}: {label}, {fullname}\n".format(level=obj_label, type="FASTENER", label=obj_label, fullname=obj.FullName)
-                        self.Verbose += "- object already added (" + str(qtd) + ")\n\n"
-                        self.PartsList[obj_label]['Qty.'] = qtd
-
-                else: # if the part is a was not added already
-                    print("ASM4> {level}| 1x | {obj_typeid} | {obj_name} | {obj_label}".format(level=self.indent(level, tag=" "), obj_label=obj_label, obj_name=obj.FullName, obj_typeid=obj.TypeId))
-
-                    self.Verbose += "> {level} | {type}: {label}, {fullname}\n".format(level=obj_label, type="FASTENER", label=obj_label, fullname=obj.FullName)
-                    self.Verbose += "- adding object (1)\n"
-
-                    self.PartsList[obj_label] = dict()
-                    for prop in self.infoKeysUser:
-                        if prop == 'Document':
-                            data = doc_name
-                        elif prop == 'Part_Label':
-                            data = obj_label
-                        elif prop == "Fastener_Diameter":
-                            data = obj.diameter
-                        elif prop == "Fastener_Type":
-                            data = obj.type
-                        elif prop == "Fastener_Length":
-                            try:
-                                data = str(obj.length).strip("mm")
-                            except:
-                                data = ""
-                        else:
-                            data = "-"
-
-                        if data != "-":
-                            self.Verbose += "- " + prop + ': ' + data + '\n'
-
-                        self.PartsList[obj_label][self.infoKeysUser.get(prop).get('userData')] = data
-
-                    self.PartsList[obj_label]['Qty.'] = 1
-                    self.Verbose += '\n'
-
-
-        # else:
-            # print("@", obj.TypeId)
-
-        #===================================
-        # Continue walking inside the groups
-        #===================================
-
-        # Navigate on objects inide a folders
-        if obj.TypeId == 'App::DocumentObjectGroup':
-            for objname in obj.getSubObjects():
-                subobj = obj.Document.getObject(objname[0:-1])
-                self.listParts(subobj, level, parent=obj)
-
-        # Navigate on objects inide a ASM4 Part (Links and Folders)
-        if obj.TypeId == 'App::Part':
-            for objname in obj.getSubObjects():
-                subobj = obj.Document.getObject(objname[0:-1])
-                # if subobj.TypeId == 'App::Link' or subobj.TypeId == 'App::DocumentObjectGroup':
-                self.listParts(subobj, level+1, parent=obj)
-
-        return
-
-        self.Verbose += '\nBOM creation is done\n'
+    # called for the parts that don't have their part info properties yet
+    def autofill(self, obj):
+        crea(self, obj)
+        fill(obj)
+
+    # the BOM itself is made by the engine in Asm4_bom
+    def listParts(self, obj):
+        if not hasattr(self, 'infoKeysUser'):
+            self.infoKeysUser = Asm4_bom.loadInfoKeys(ConfUserFilejson)
+        engine = Asm4_bom.bomEngine(self.infoKeysUser, self.follow_subassemblies, self.autofill,
+                                    cache=Asm4_bom.getCache())
+        engine.build(obj)
+        self.engine = engine
+        self.PartsList = engine.rows
+        self.Header = engine.header()
+        self.Verbose += engine.report()
 
     # Copy Parts list to Spreadsheet
     def inSpreadsheet(self):
@@ -475,28 +155,34 @@ class makeBOM:
                 spreadsheet = document.BOM_Local
             spreadsheet.Label = "BOM_Local"
 
-        spreadsheet.clearAll()
-
-
-        # Write rows in the spreadsheet
-        def wrow(drow: [str], row: int):
-            for i, d in enumerate(drow):
-                if row == 0:
-                    spreadsheet.set(str(chr(ord('a') + i)).upper() + str(row + 1), infoPartCmd.decodeXml(str(d)))
-                else:
-                    spreadsheet.set(str(chr(ord('a') + i)).upper() + str(row + 1), str(d))
-
         data = list(plist.values()) # present data in the order it is in the Object tree
 
-        wrow(data[0].keys(), 0)
-        for i, _ in enumerate(data):
-            wrow(data[i].values(), i + 1)
+        # rows of different kinds of objects don't all have the same columns
+        header = self.Header
+        # the whole table is written at once
+        table = Asm4_sheet.tableWriter(spreadsheet)
+        table.setRow( 1, [ infoPartCmd.decodeXml(str(d)) for d in header ] )
+        for i, row in enumerate(data):
+            table.setRow( i + 2, [ row.get(col, '-') for col in header ] )
+        table.commit(clear=True)
 
         document.recompute()
 
         self.Verbose += "\n" + spreadsheet.Label + ' spreadsheet was created.\n'
 
 
+    # write the BOM to a data file, without the spreadsheet
+    def onExport(self):
+        fileName = QtGui.QFileDialog.getSaveFileName( self.UI, 'Export the BOM', 'BOM.csv',
+                        'CSV (*.csv);;JSON lines (*.jsonl);;Parquet (*.parquet)' )[0]
+        if fileName:
+            try:
+                rows = Asm4_bom.exportBOM( self.engine, fileName )
+                self.Verbose += '\n' + str(rows) + ' rows exported to ' + fileName + '\n'
+            except Exception as err:
+                self.Verbose += '\nBOM export failed: ' + str(err) + '\n'
+            self.BOM.setPlainText(self.Verbose)
+
     def onOK(self):
         document = App.ActiveDocument
         if self.follow_subassemblies:
@@ -535,6 +221,11 @@ class makeBOM:
         # the button row definition
         self.buttonLayout = QtGui.QHBoxLayout()
 
+        # Export button
+        self.ExportButton = QtGui.QPushButton('Export')
+        self.buttonLayout.addWidget(self.ExportButton)
+        self.buttonLayout.addStretch()
+
         # OK button
         self.OkButton = QtGui.QPushButton('OK')
         self.OkButton.setDefault(True)
@@ -546,6 +237,7 @@ class makeBOM:
 
         # Actions
         self.OkButton.clicked.connect(self.onOK)
+        self.ExportButton.clicked.connect(self.onExport)
 
 
 # Add the command in the workbench
@@ -15,6 +15,7 @@ import FreeCAD as App
 from FreeCAD import Console as FCC
 
 import Asm4_libs as Asm4
+import Asm4_selection
 
 
 
@@ -174,7 +175,8 @@ class newHole:
                 }
 
     def IsActive(self):
-        selection = self.getSelectedEdges()
+        # parsing the edges is only done when the selection changes
+        selection = Asm4_selection.cached( 'holeEdges', self.getSelectedEdges )
         if selection is None:
             return False
         else:
@@ -194,10 +196,9 @@ class newHole:
         # 1 selection means a single parent        
         if App.ActiveDocument and len(Gui.Selection.getSelection()) == 1:
             parent = Gui.Selection.getSelection()[0]
+            selEx = Gui.Selection.getSelectionEx()[0]
             # parse all sub-elemets of the selection
-            for i in range(len(Gui.Selection.getSelectionEx()[0].SubObjects)):
-                edgeObj  = Gui.Selection.getSelectionEx()[0].SubObjects[i]
-                edgeName = Gui.Selection.getSelectionEx()[0].SubElementNames[i]                    
+            for edgeObj, edgeName in zip( selEx.SubObjects, selEx.SubElementNames ):
                 # if the edge is circular
                 if Asm4.isCircle(edgeObj):
                     edges.append( [edgeObj,edgeName] )
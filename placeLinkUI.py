@@ -15,6 +15,7 @@ import FreeCAD as App
 from FreeCAD import Console as FCC
 
 import Asm4_libs as Asm4
+import Asm4_solver
 from placePartUI import placePartUI
 import selectionFilter
 
@@ -161,18 +162,15 @@ class placeLinkUI():
                 if firstLCSItem is not None:
                     self.partLCSlist.setCurrentItem(firstLCSItem)
 
-        # find all the linked parts in the assembly
-        for obj in self.activeDoc.findObjects("App::Link"):
-            if self.rootAssembly.getObject(obj.Name) is not None and hasattr(obj.LinkedObject,'isDerivedFrom'):
-                linkedObj = obj.LinkedObject
-                if linkedObj.isDerivedFrom('App::Part') or linkedObj.isDerivedFrom('PartDesign::Body'):
-                # ... except if it's the selected link itself
-                    if obj != self.selectedObj:
-                        self.parentTable.append( obj )
-                        # add to the drop-down combo box with the assembly tree's parts
-                        objIcon = linkedObj.ViewObject.Icon
-                        objText = Asm4.labelName(obj)
-                        self.parentList.addItem( objIcon, objText, obj)
+        # find all the linked parts in the assembly, the index has them already
+        for obj in self.assemblyLinks():
+            # ... except if it's the selected link itself
+            if obj != self.selectedObj:
+                self.parentTable.append( obj )
+                # add to the drop-down combo box with the assembly tree's parts
+                objIcon = obj.LinkedObject.ViewObject.Icon
+                objText = Asm4.labelName(obj)
+                self.parentList.addItem( objIcon, objText, obj)
 
         # find the oldPart in the part list...
         parent_index = 1
@@ -204,6 +202,21 @@ class placeLinkUI():
         Gui.Selection.addObserver(self, 0)
 
 
+    # the links to a Part or a Body in the assembly
+    def assemblyLinks(self):
+        graph = Asm4_solver.getGraph(self.activeDoc)
+        if graph is not None and graph.assembly == self.rootAssembly:
+            return graph.getLinks()
+        # no index for this document, scan its objects
+        links = []
+        for obj in self.activeDoc.findObjects("App::Link"):
+            if self.rootAssembly.getObject(obj.Name) is not None and hasattr(obj.LinkedObject,'isDerivedFrom'):
+                linkedObj = obj.LinkedObject
+                if linkedObj.isDerivedFrom('App::Part') or linkedObj.isDerivedFrom('PartDesign::Body'):
+                    links.append(obj)
+        return links
+
+
     # Close
     def finish(self):
         # remove the  observer
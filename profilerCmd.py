@@ -0,0 +1,143 @@
+#!/usr/bin/env python3
+# coding: utf-8
+#
+# profilerCmd.py
+#
+# LGPL
+# Copyright HUBERT Zoltán
+#
+# shows the summary of the calls recorded by Asm4_profiler
+
+
+import os
+
+from PySide import QtGui, QtCore
+import FreeCADGui as Gui
+import FreeCAD as App
+
+import Asm4_libs as Asm4
+import Asm4_profiler
+
+
+
+"""
+    +-----------------------------------------------+
+    |                  main class                   |
+    +-----------------------------------------------+
+"""
+class profilerSummary():
+
+    # the columns of the table: title and key in the summary
+    columns = [ ('Command / Object', 'name'),
+                ('Calls',            'calls'),
+                ('Total (s)',        'total'),
+                ('Mean (s)',         'mean'),
+                ('Max (s)',          'max'),
+                ('Recomputes',       'recomputes'),
+                ('Errors',           'errors'),
+                ('Slowest on',       'slowest') ]
+
+    def __init__(self):
+        super(profilerSummary,self).__init__()
+        self.UI = None
+
+    def GetResources(self):
+        return {"MenuText": "Profiler summary",
+                "ToolTip": "Show the time spent in the Assembly4 commands and objects",
+                "Pixmap" : os.path.join( Asm4.iconPath , 'Asm4_Solver.svg')
+                }
+
+    def IsActive(self):
+        return True
+
+    def Activated(self):
+        if self.UI is None:
+            self.UI = QtGui.QDialog()
+            self.drawUI()
+        self.enabledCheck.setChecked(Asm4_profiler.enabled)
+        self.fillTable()
+        self.UI.show()
+
+
+    def fillTable(self):
+        summary = Asm4_profiler.summary()
+        self.table.setSortingEnabled(False)
+        self.table.setRowCount(len(summary))
+        for row, stat in enumerate(summary):
+            for col, (title, key) in enumerate(self.columns):
+                value = stat[key]
+                item = QtGui.QTableWidgetItem()
+                if isinstance(value, float):
+                    item.setData( QtCore.Qt.DisplayRole, round(value, 4) )
+                else:
+                    item.setData( QtCore.Qt.DisplayRole, value )
+                self.table.setItem(row, col, item)
+        self.table.setSortingEnabled(True)
+        self.table.resizeColumnsToContents()
+        self.status.setText( str(len(Asm4_profiler.records))+' call(s) recorded' )
+
+
+    def onEnable(self, state):
+        if self.enabledCheck.isChecked():
+            Asm4_profiler.enable(save=True)
+        else:
+            Asm4_profiler.disable(save=True)
+
+    def onClear(self):
+        Asm4_profiler.clear()
+        self.fillTable()
+
+    def onExport(self):
+        fileName = QtGui.QFileDialog.getSaveFileName( self.UI, 'Export profiler records',
+                        'Asm4_profile.json', 'JSON (*.json);;CSV (*.csv)' )[0]
+        if fileName:
+            if fileName.lower().endswith('.csv'):
+                Asm4_profiler.exportCSV(fileName)
+            else:
+                Asm4_profiler.exportJSON(fileName)
+
+
+    # defines the UI, only static elements
+    def drawUI(self):
+        self.UI.setWindowTitle('Assembly4 profiler')
+        self.UI.setWindowIcon( QtGui.QIcon( os.path.join( Asm4.iconPath , 'FreeCad.svg' ) ) )
+        self.UI.resize(700,400)
+        self.UI.setModal(False)
+        mainLayout = QtGui.QVBoxLayout(self.UI)
+        # enable the recording
+        self.enabledCheck = QtGui.QCheckBox('Record the calls of Assembly4 commands and objects')
+        mainLayout.addWidget(self.enabledCheck)
+        # the summary
+        self.table = QtGui.QTableWidget( 0, len(self.columns) )
+        self.table.setHorizontalHeaderLabels( [ title for (title, key) in self.columns ] )
+        self.table.setEditTriggers(QtGui.QAbstractItemView.NoEditTriggers)
+        mainLayout.addWidget(self.table)
+        self.status = QtGui.QLabel()
+        mainLayout.addWidget(self.status)
+        # the buttons
+        buttonLayout = QtGui.QHBoxLayout()
+        self.refreshButton = QtGui.QPushButton('Refresh')
+        self.clearButton   = QtGui.QPushButton('Clear')
+        self.exportButton  = QtGui.QPushButton('Export')
+        self.closeButton   = QtGui.QPushButton('Close')
+        buttonLayout.addWidget(self.refreshButton)
+        buttonLayout.addWidget(self.clearButton)
+        buttonLayout.addWidget(self.exportButton)
+        buttonLayout.addStretch()
+        buttonLayout.addWidget(self.closeButton)
+        mainLayout.addLayout(buttonLayout)
+        # actions
+        self.enabledCheck.stateChanged.connect(self.onEnable)
+        self.refreshButton.clicked.connect(self.fillTable)
+        self.clearButton.clicked.connect(self.onClear)
+        self.exportButton.clicked.connect(self.onExport)
+        self.closeButton.clicked.connect(self.UI.close)
+
+
+
+"""
+    +-----------------------------------------------+
+    |       add the command to the workbench        |
+    +-----------------------------------------------+
+"""
+Gui.addCommand( 'Asm4_profiler', profilerSummary() )
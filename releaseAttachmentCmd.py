@@ -15,6 +15,7 @@ import FreeCAD as App
 import Part
 
 import Asm4_libs as Asm4
+import Asm4_solver
 
 
 
@@ -77,6 +78,10 @@ class releaseAttachment:
         # ask for confirmation before resetting everything
         confirmText = 'This command will release all attachments on '+Asm4.labelName(selectedObj) \
                     +' and set it to manual positioning in its current location.'
+        # tell the user what else will move
+        graph = Asm4_solver.getGraph(selectedObj.Document)
+        if graph and graph.dependentsOf(objName):
+            confirmText += '\n'+str(len(graph.dependentsOf(objName)))+' object(s) attached to it will follow.'
         if not Asm4.confirmBox(confirmText):
             # don't do anything
             return
@@ -104,8 +109,8 @@ class releaseAttachment:
                 # so it's easy for the user to re-enable it
                 selectedObj.MapMode = 'Deactivated'
 
-        # recompute the assembly model
-        model.recompute(True)
+        # update the released object and what is attached to it
+        Asm4_solver.updateAssembly(model.Document)
 
 
 
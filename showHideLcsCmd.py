@@ -9,6 +9,7 @@ import FreeCADGui as Gui
 import FreeCAD as App
 
 import Asm4_libs as Asm4
+import Asm4_solver
 from Asm4_Translate import QT_TRANSLATE_NOOP as Qtranslate
 
 
@@ -96,12 +97,19 @@ def showChildLCSs(obj, show, processedLinks):
     # if its a datum apply the visibility
     if obj.TypeId in Asm4.datumTypes:
         obj.Visibility = show
-    # if it's a link, look for subObjects
+    # if it's a link, use the cached datums and links of the linked container
     elif obj.TypeId == 'App::Link' and obj.Name not in processedLinks:
         processedLinks.append(obj.Name)
-        for objName in obj.LinkedObject.getSubObjects(1):
-            linkedObj = obj.LinkedObject.Document.getObject(objName[0:-1])
-            showChildLCSs(linkedObj, show, processedLinks)
+        if obj.LinkedObject is None:
+            return
+        if obj.LinkedObject.TypeId in Asm4.containerTypes:
+            (datums, links) = Asm4_solver.getContents(obj.LinkedObject)
+            for datum in datums:
+                datum.Visibility = show
+            for link in links:
+                showChildLCSs(link, show, processedLinks)
+        else:
+            showChildLCSs(obj.LinkedObject, show, processedLinks)
     # if it's a container or a group
     elif obj.TypeId in Asm4.containerTypes or obj.TypeId=='App::DocumentObjectGroup':
         for subObjName in obj.getSubObjects(1):
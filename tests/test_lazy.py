@@ -0,0 +1,147 @@
+#!/usr/bin/env python3
+# coding: utf-8
+#
+# test_lazy.py
+#
+# LGPL
+# Copyright HUBERT Zoltán
+#
+# the lazy commands with the profiler's hook around them, in the order of
+# InitGui.Initialize(), without FreeCAD: its modules are replaced by fakes
+#
+#   python -m unittest discover tests
+
+
+
+import os, sys, types, unittest
+
+sys.path.insert( 0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))) )
+
+
+
+"""
+    +-----------------------------------------------+
+    |            a fake FreeCAD / FreeCADGui        |
+    +-----------------------------------------------+
+"""
+class fakeParameters():
+
+    def GetBool(self, name, default=False):
+        return default
+
+    def GetInt(self, name, default=0):
+        return default
+
+    def SetBool(self, name, value):
+        pass
+
+
+class fakeConsole():
+
+    def __init__(self):
+        self.errors = []
+
+    def PrintError(self, text):
+        self.errors.append(text)
+
+    def PrintWarning(self, text):
+        pass
+
+    def PrintMessage(self, text):
+        pass
+
+
+# the commands registered in the GUI
+commands = {}
+
+def rawAddCommand( name, command, *args ):
+    commands[name] = command
+
+
+def fakeFreeCAD():
+    App = types.ModuleType('FreeCAD')
+    App.Console = fakeConsole()
+    App.ActiveDocument = None
+    App.ParamGet = lambda path: fakeParameters()
+    App.addDocumentObserver = lambda observer: None
+    App.removeDocumentObserver = lambda observer: None
+    Gui = types.ModuleType('FreeCADGui')
+    Gui.addCommand = rawAddCommand
+    Gui.listCommands = lambda: list(commands)
+    Asm4 = types.ModuleType('Asm4_libs')
+    Asm4.iconPath = ''
+    Asm4.getAssembly = lambda: None
+    sys.modules.update( { 'FreeCAD': App, 'FreeCADGui': Gui, 'Asm4_libs': Asm4 } )
+    return App, Gui
+
+
+# the module of the lazy command, registers its command when imported
+moduleSource = '''
+import FreeCADGui as Gui
+
+class testCommand():
+    activated = 0
+    def GetResources(self):
+        return { "MenuText": "Test", "ToolTip": "A test command", "Pixmap": "test.svg" }
+    def IsActive(self):
+        return True
+    def Activated(self):
+        testCommand.activated += 1
+
+Gui.addCommand( 'Asm4_test', testCommand() )
+'''
+
+
+
+"""
+    +-----------------------------------------------+
+    |                   the tests                   |
+    +-----------------------------------------------+
+"""
+class lazyCommandsTest(unittest.TestCase):
+
+    def setUp(self):
+        commands.clear()
+        self.App, self.Gui = fakeFreeCAD()
+        for name in [ 'Asm4_lazy', 'Asm4_profiler', 'Asm4_lazytest' ]:
+            sys.modules.pop(name, None)
+        import Asm4_profiler, Asm4_lazy
+        self.profiler = Asm4_profiler
+        self.lazy = Asm4_lazy
+        Asm4_lazy.lazyModules['Asm4_lazytest'] = { 'Asm4_test': ( 'Test', 'A test command', 'test.svg', False ) }
+        module = types.ModuleType('Asm4_lazytest')
+        self.loader = lambda: exec( moduleSource, module.__dict__ ) or sys.modules.setdefault('Asm4_lazytest', module)
+
+    def tearDown(self):
+        for name in [ 'Asm4_lazy', 'Asm4_profiler', 'Asm4_lazytest', 'FreeCAD', 'FreeCADGui', 'Asm4_libs' ]:
+            sys.modules.pop(name, None)
+
+    # hook, lazy registration, unhook and a first activation, as in InitGui
+    def test_activation_after_unhook(self):
+        self.profiler.hookCommands()
+        self.lazy.addLazyModule('Asm4_lazytest')
+        self.profiler.unhookCommands()
+        stub = commands['Asm4_test']
+        self.assertIsInstance( stub, self.lazy.lazyCommand )
+        # importing the module is what loadModule() does
+        self.lazy.loadModule = lambda moduleName: self.loader()
+        stub.Activated()
+        self.assertIs( commands['Asm4_test'], stub )
+        self.assertIsNotNone( stub.command )
+        self.assertEqual( type(stub.command).activated, 1 )
+        self.assertEqual( self.App.Console.errors, [] )
+        self.assertEqual( stub.differences(), [] )
+
+    # the other commands are still registered, and not profiled after unhook
+    def test_other_commands(self):
+        self.profiler.hookCommands()
+        self.lazy.addLazyModule('Asm4_lazytest')
+        self.profiler.unhookCommands()
+        command = types.SimpleNamespace( Activated=lambda: None )
+        self.Gui.addCommand( 'Other_command', command )
+        self.assertIs( commands['Other_command'], command )
+        self.assertFalse( getattr(command.Activated, 'profiled', False) )
+
+
+if __name__ == '__main__':
+    unittest.main()
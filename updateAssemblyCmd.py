@@ -12,6 +12,7 @@ import FreeCAD as App
 import Part
 
 import Asm4_libs as Asm4
+import Asm4_solver
 
 
 
@@ -36,11 +37,9 @@ class updateAssembly:
     +-----------------------------------------------+
     """
     def Activated(self):
-        # find every Part in the document ...
-        for obj in App.ActiveDocument.Objects:
-            # ... and update it
-            if obj.TypeId == 'App::Part':
-                obj.recompute(True)
+        # recompute only what has changed since the last update,
+        # this falls back to updating every Part if that is unknown
+        Asm4_solver.updateAssembly(App.ActiveDocument)
         #App.ActiveDocument.recompute()
 
 